@@ -0,0 +1,177 @@
+"""
+Adaptive simulation: draw batches until the results stop moving.
+
+Instead of a fixed simulation count, models are simulated in equal batches,
+each from its own independent stream. Every batch gives an independent
+estimate of the mean annual loss and of the chosen percentiles, so the
+spread of those estimates across batches gives each statistic's standard
+error. Simulation stops once every statistic of every model (and of their
+total, for a meta model) is known to within a relative tolerance at 95%
+confidence, or once the simulation budget is spent.
+
+Low-variance models stop after a few batches; heavy-tailed ones keep going
+until their tails settle.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+import engine
+import streaming
+
+DEFAULT_BATCH_SIZE = 5_000
+DEFAULT_TOLERANCE = 0.01
+DEFAULT_PERCENTILES = (0.9, 0.95)
+# Batches needed before their spread is trusted as an error estimate
+MIN_BATCHES = 4
+# Confidence level of the intervals checked against the tolerance
+CONFIDENCE = 0.95
+
+
+def batch_statistics(risk, percentiles=DEFAULT_PERCENTILES):
+    """
+    Mean and percentiles of one batch of simulated annual loss.
+
+    Returns:
+        - np.ndarray: [mean, percentile, ...]
+    """
+    return np.concatenate(([np.mean(risk)], np.quantile(risk, percentiles)))
+
+
+def statistic_names(percentiles=DEFAULT_PERCENTILES):
+    """Labels of the batch_statistics values: Mean, P90, P95, ..."""
+    return ["Mean"] + [f"P{q * 100:g}" for q in percentiles]
+
+
+def relative_errors(estimates):
+    """
+    Relative 95% confidence half-widths of statistics estimated per batch.
+
+    The half-width uses Student's t with one fewer degrees of freedom than
+    batches, so a few batches that happen to agree do not stop a run early.
+
+    Parameters:
+        - estimates (np.ndarray): One row per batch, one column per statistic
+
+    Returns:
+        - np.ndarray: Half-width over the absolute mean estimate, per
+          statistic. Statistics that are zero in every batch count as exact.
+    """
+    estimates = np.asarray(estimates, dtype=np.float64)
+    n_batches = len(estimates)
+    if n_batches < 2:
+        return np.full(estimates.shape[1], np.inf)
+    import scipy.stats
+
+    t = scipy.stats.t.ppf((1 + CONFIDENCE) / 2, n_batches - 1)
+    half_width = t * estimates.std(axis=0, ddof=1) / math.sqrt(n_batches)
+    centre = np.abs(estimates.mean(axis=0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(half_width == 0, 0.0, half_width / centre)
+
+
+def convergence_table(risks, batch_size, percentiles=DEFAULT_PERCENTILES):
+    """
+    Relative errors of finished adaptive results, one row per model.
+
+    Parameters:
+        - risks (dict): Model name -> simulated annual loss, made of whole
+          batches of batch_size in simulation order
+
+    Returns:
+        - pd.DataFrame: Relative 95% half-width of each statistic
+    """
+    table = {}
+    for name, risk in risks.items():
+        batches = np.reshape(risk, (-1, batch_size))
+        estimates = [batch_statistics(batch, percentiles) for batch in batches]
+        table[name] = relative_errors(estimates)
+    return pd.DataFrame(table, index=statistic_names(percentiles)).T
+
+
+def simulate_until_converged(
+    model_inputs,
+    max_simulations,
+    tolerance=DEFAULT_TOLERANCE,
+    percentiles=DEFAULT_PERCENTILES,
+    batch_size=DEFAULT_BATCH_SIZE,
+    random_seeds=None,
+    sampler=engine.MONTE_CARLO,
+    meta_model=False,
+    progress=None,
+):
+    """
+    Simulates models batch by batch until their statistics converge.
+
+    All models share one simulation count, so they can still be combined
+    in a meta model. Derived Vulnerability is estimated per batch while
+    checking convergence and over all draws for the returned results.
+
+    Parameters:
+        - model_inputs (list): One engine input dict per model
+        - max_simulations (int): Budget; rounded down to whole batches but
+          at least MIN_BATCHES of them
+        - tolerance (float): Largest accepted relative 95% half-width
+        - percentiles (tuple): Percentiles checked besides the mean
+        - batch_size (int): Draws per model per batch
+        - random_seeds (list): One seed per model; batch streams are
+          spawned from it as in streaming.chunk_seeds
+        - sampler (str): One of engine.SAMPLERS, applied per batch
+        - meta_model (bool): Also require the summed risk to converge
+        - progress (callable): Optional progress(fraction, message), called
+          after each batch
+
+    Returns:
+        - results (list): A SimulationResult per model
+        - converged (bool): Whether the tolerance was met within budget
+    """
+    if tolerance <= 0:
+        raise ValueError("Tolerance must be positive.")
+    report = progress or (lambda fraction, message: None)
+    random_seeds = random_seeds or [
+        engine.model_seed(42, i) for i in range(len(model_inputs))
+    ]
+    max_batches = max(max_simulations // batch_size, MIN_BATCHES)
+    seeds = [streaming.chunk_seeds(seed, max_batches) for seed in random_seeds]
+    checked = len(model_inputs) + (1 if meta_model and len(model_inputs) > 1 else 0)
+    estimates = [[] for _ in range(checked)]
+    batches = [[] for _ in model_inputs]
+
+    converged = False
+    for batch in range(max_batches):
+        risks = []
+        for i, inputs in enumerate(model_inputs):
+            result = engine.simulate_model(
+                inputs, batch_size, random_seed=seeds[i][batch], sampler=sampler
+            )
+            batches[i].append(result)
+            risks.append(result["Risk"])
+        if checked > len(model_inputs):
+            risks.append(np.sum(risks, axis=0))
+        for i, risk in enumerate(risks):
+            estimates[i].append(batch_statistics(risk, percentiles))
+
+        n_done = (batch + 1) * batch_size
+        if batch + 1 < MIN_BATCHES:
+            report(n_done / (max_batches * batch_size), f"Simulated {n_done:,}")
+            continue
+        error = max(float(np.max(relative_errors(e))) for e in estimates)
+        report(
+            n_done / (max_batches * batch_size),
+            f"Simulated {n_done:,}, largest relative error {error:.2%}",
+        )
+        if error <= tolerance:
+            converged = True
+            break
+
+    results = []
+    for parts in batches:
+        result = engine.SimulationResult(
+            parts[0].columns,
+            np.concatenate([part.values for part in parts], axis=1),
+            parts[0].calculated,
+        )
+        results.append(engine.derive_nodes(result))
+    return results, converged
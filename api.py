@@ -0,0 +1,353 @@
+"""
+Headless HTTP JSON API for risk calculations.
+
+Other tools can score scenarios without driving the Streamlit UI. A request
+body is one scenario in the format of batch.py: the results_args keys of
+main.py (lm_low_1, tef_mode_1, ...; loss magnitudes in pounds) plus the
+optional simulations, seed, use_tef, use_vuln, two_model and meta_model.
+
+    POST /calculate                 JSON summary.ale_summary of each model
+    POST /calculate?output=arrays   Each model's simulated Risk, streamed as
+                                    newline-delimited JSON in chunks
+    GET  /health                    Liveness and batching settings
+
+Requests arriving within BATCH_WINDOW of each other are micro-batched:
+those with the same simulation count and node layout are simulated in one
+portfolio.simulate_portfolio call, i.e. as rows of one vectorized
+inverse-CDF pass, and identical requests share a single run. Batches run on
+a pool of worker threads, warmed up (imports and inverse-CDF tables) when
+the server starts. Each model draws from its own engine.model_seed stream,
+so a response never depends on what it was batched with. Like the
+portfolio page, results agree with the main page's pyfair-identical draws
+in distribution, not draw for draw.
+
+Usage:
+    python api.py --port 8600 --workers 4
+"""
+
+import argparse
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import batch
+import engine
+import jobs
+import metrics
+import portfolio
+import streaming
+import summary
+import warmup
+from cache import make_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8600
+# Seconds a batch waits for more requests after its first one arrives
+BATCH_WINDOW = 0.005
+# Requests per batch
+MAX_BATCH = 64
+# Largest simulation count accepted per request
+MAX_SIMULATIONS = 5_000_000
+# Seconds a request waits for its batch before giving up
+REQUEST_TIMEOUT = 300
+# Values per line of a streamed arrays response
+ARRAY_CHUNK = streaming.DEFAULT_CHUNK_SIZE
+
+
+class CalculationRequest:
+    """One parsed and validated request, waiting for its batch."""
+
+    def __init__(self, scenario):
+        _, arguments = batch.scenario_arguments(scenario)
+        self.simulations = arguments.pop("simulations")
+        self.seed = arguments.pop("seed")
+        self.use_tef = arguments.pop("use_tef")
+        self.use_vuln = arguments.pop("use_vuln")
+        two_model = arguments.pop("two_model")
+        self.meta_model = arguments.pop("meta_model")
+        if not 1 <= self.simulations <= MAX_SIMULATIONS:
+            raise ValueError(f"simulations must be between 1 and {MAX_SIMULATIONS:,}.")
+        names = ["Risk Type 1", "Risk Type 2"] if two_model else ["Risk Type 1"]
+        prefixes = portfolio.node_prefixes(self.use_tef, self.use_vuln)
+        self.inputs = {
+            name: {
+                target: {
+                    parameter: arguments.get(f"{prefix}_{parameter}_{name[-1]}")
+                    for parameter in ("low", "mode", "high")
+                }
+                for target, prefix in prefixes.items()
+            }
+            for name in names
+        }
+        # Reject bad inputs here, so they cannot fail the rest of a batch
+        for inputs in self.inputs.values():
+            for target, params in inputs.items():
+                engine.check_inputs(target, **params)
+        self.key = make_key(
+            simulations=self.simulations,
+            seed=self.seed,
+            meta_model=self.meta_model,
+            inputs=self.inputs,
+        )
+        self.future = Future()
+
+    @property
+    def group(self):
+        """Requests with equal groups can be simulated together."""
+        return self.simulations, self.use_tef, self.use_vuln
+
+
+class Batcher:
+    """
+    Collects concurrent requests into batches and runs them on worker threads.
+
+    Parameters:
+        - window (float): Seconds to wait for more requests once one arrives
+        - max_batch (int): Requests per batch
+        - workers (int): Worker threads; defaults to jobs.max_workers()
+    """
+
+    def __init__(self, window=BATCH_WINDOW, max_batch=MAX_BATCH, workers=None):
+        self.window = window
+        self.max_batch = max_batch
+        self.workers = workers or jobs.max_workers()
+        self._queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="api-batch")
+        self._thread = threading.Thread(
+            target=self._dispatch, name="api-dispatch", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, request):
+        """Queues a CalculationRequest; its future yields model name -> Risk."""
+        self._queue.put(request)
+        return request.future
+
+    def close(self):
+        """Stops dispatching and waits for running batches."""
+        self._queue.put(None)
+        self._thread.join()
+        self._pool.shutdown()
+
+    def _dispatch(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            requests = [request]
+            deadline = time.monotonic() + self.window
+            while len(requests) < self.max_batch:
+                try:
+                    request = self._queue.get(
+                        timeout=max(deadline - time.monotonic(), 0)
+                    )
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._queue.put(None)
+                    break
+                requests.append(request)
+            groups = {}
+            for request in requests:
+                groups.setdefault(request.group, []).append(request)
+            for group in groups.values():
+                self._pool.submit(self._run, group)
+
+    def _run(self, requests):
+        """Simulates a group of compatible requests as one portfolio."""
+        unique = {}
+        for request in requests:
+            unique.setdefault(request.key, []).append(request)
+        model_inputs, seeds = [], []
+        for first, *_ in unique.values():
+            for i, inputs in enumerate(first.inputs.values()):
+                model_inputs.append(inputs)
+                seeds.append(engine.model_seed(first.seed, i))
+        try:
+            with metrics.stage("api_batch"):
+                result = portfolio.simulate_portfolio(
+                    [str(i) for i in range(len(model_inputs))],
+                    model_inputs,
+                    requests[0].simulations,
+                    random_seeds=seeds,
+                )
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        rows = iter(result.risk)
+        for first, *_ in unique.values():
+            risks = {name: next(rows) for name in first.inputs}
+            if first.meta_model:
+                risks["Meta Model"] = np.sum(list(risks.values()), axis=0)
+            for request in unique[first.key]:
+                request.future.set_result(risks)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    batcher = None
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self._send_json(404, {"error": "Not found."})
+            return
+        self._send_json(
+            200,
+            {
+                "status": "ok",
+                "workers": self.batcher.workers,
+                "batch_window": self.batcher.window,
+                "max_batch": self.batcher.max_batch,
+            },
+        )
+
+    def do_POST(self):
+        started = time.perf_counter()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        url = urlparse(self.path)
+        if url.path != "/calculate":
+            self._send_json(404, {"error": "Not found."})
+            return
+        output = parse_qs(url.query).get("output", ["summary"])[0]
+        if output not in ("summary", "arrays"):
+            self._send_json(400, {"error": 'output must be "summary" or "arrays".'})
+            return
+        try:
+            scenario = json.loads(body or b"{}")
+            if not isinstance(scenario, dict):
+                raise ValueError("Body must be a JSON object.")
+            request = CalculationRequest(scenario)
+        except Exception as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        try:
+            risks = self.batcher.submit(request).result(timeout=REQUEST_TIMEOUT)
+        except Exception as e:
+            logger.exception("Calculation failed")
+            self._send_json(500, {"error": str(e)})
+            return
+        if output == "summary":
+            self._send_json(
+                200,
+                {
+                    "simulations": request.simulations,
+                    "seed": request.seed,
+                    "models": {
+                        name: summary.ale_summary(risk) for name, risk in risks.items()
+                    },
+                },
+            )
+        else:
+            self._stream_arrays(request, risks)
+        metrics.record("api_request", time.perf_counter() - started, output=output)
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream_arrays(self, request, risks):
+        """
+        Writes a header line, then one line per model per ARRAY_CHUNK values.
+
+        Lines are {"model": name, "offset": first index, "risk": [...]}, sent
+        with chunked transfer encoding as they are serialised.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(line):
+            data = (json.dumps(line) + "\n").encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        send(
+            {
+                "simulations": request.simulations,
+                "seed": request.seed,
+                "models": list(risks),
+            }
+        )
+        for name, risk in risks.items():
+            for offset in range(0, risk.size, ARRAY_CHUNK):
+                chunk = risk[offset : offset + ARRAY_CHUNK]
+                send({"model": name, "offset": offset, "risk": chunk.tolist()})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 resets connections under concurrent load
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def create_server(host="127.0.0.1", port=DEFAULT_PORT, batcher=None):
+    """
+    Builds the API server; call serve_forever() on it to start serving.
+
+    Returns:
+        - ThreadingHTTPServer: Server with a batcher attribute
+    """
+    handler = type("Handler", (_Handler,), {"batcher": batcher or Batcher()})
+    server = _Server((host, port), handler)
+    server.batcher = handler.batcher
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve risk calculations over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Batch worker threads"
+    )
+    parser.add_argument(
+        "--window",
+        type=float,
+        default=BATCH_WINDOW * 1000,
+        help="Batching window in milliseconds",
+    )
+    parser.add_argument(
+        "--max-batch", type=int, default=MAX_BATCH, help="Requests per batch"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    warmup.warm_up()
+    metrics.serve_from_env()
+    metrics.trace_memory_from_env()
+    server = create_server(
+        args.host,
+        args.port,
+        Batcher(args.window / 1000, args.max_batch, args.workers),
+    )
+    print(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
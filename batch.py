@@ -0,0 +1,175 @@
+"""
+Headless batch runner for scoring many risk scenarios from a file.
+
+Each scenario is one row of a CSV file (or one mapping in a YAML list) using
+the same keys as results_args in main.py, e.g. lm_low_1, tef_mode_1,
+vuln_high_1. Loss magnitudes are given in pounds, as calculate_risk
+receives them, not in the £ million shown in the UI. Optional keys:
+
+    scenario     name used in the output (default: row number)
+    simulations  simulation count (default: --simulations)
+    seed         random seed (default: --seed)
+    use_tef, use_vuln, two_model, meta_model
+                 flags as in the UI; use_tef/use_vuln default to whether
+                 tef_*/vuln_* values are present, two_model to whether any
+                 *_2 values are present, meta_model to two_model
+
+Usage:
+    python batch.py scenarios.csv -o summary.csv --workers 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+RESULT_ARG = re.compile(
+    r"^(lm|tef|contact|action|vuln|threat|control)_(low|mode|high)_[12]$"
+)
+
+
+def load_scenarios(path):
+    """Reads scenarios from a CSV or YAML file into a list of dicts."""
+    path = Path(path)
+    if path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            sys.exit("Install PyYAML to read YAML scenario files.")
+        data = yaml.safe_load(path.read_text())
+        if isinstance(data, dict):
+            data = data.get("scenarios", [])
+        return [dict(row) for row in data]
+    df = pd.read_csv(path)
+    return [
+        {key: value for key, value in row.items() if not pd.isna(value)}
+        for row in df.to_dict(orient="records")
+    ]
+
+
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def scenario_arguments(scenario, simulations=10000, seed=42):
+    """
+    Turns a scenario dict into calculate_risk keyword arguments.
+
+    Returns:
+        - name (str): Scenario name
+        - arguments (dict): Keyword arguments for calculate_risk
+    """
+    results_args = {
+        key: float(value) for key, value in scenario.items() if RESULT_ARG.match(key)
+    }
+    two_model = _as_bool(
+        scenario.get("two_model", any(key.endswith("_2") for key in results_args))
+    )
+    arguments = {
+        "simulations": int(scenario.get("simulations", simulations)),
+        "seed": int(scenario.get("seed", seed)),
+        "use_tef": _as_bool(
+            scenario.get("use_tef", any(key.startswith("tef_") for key in results_args))
+        ),
+        "use_vuln": _as_bool(
+            scenario.get(
+                "use_vuln", any(key.startswith("vuln_") for key in results_args)
+            )
+        ),
+        "two_model": two_model,
+        "meta_model": _as_bool(scenario.get("meta_model", two_model)) and two_model,
+        **results_args,
+    }
+    return str(scenario.get("scenario", "")), arguments
+
+
+def _init_worker():
+    """Keeps each worker single-process; the batch pool already uses every core."""
+    os.environ["PYFAIR_WORKERS"] = "1"
+    warnings.simplefilter(action="ignore", category=FutureWarning)
+
+
+def run_scenario(name, arguments):
+    """Runs one scenario and returns its Risk summary rows as a DataFrame."""
+    import export
+    from main import calculate_risk
+
+    try:
+        fsr, model1, model2, mm = calculate_risk(use_cache=False, **arguments)
+    except Exception as e:
+        return pd.DataFrame([{"Scenario": name, "Error": str(e)}])
+    sheets = {"Risk Type 1": model1.export_results()[["Risk"]]}
+    if model2 is not None:
+        sheets["Risk Type 2"] = model2.export_results()[["Risk"]]
+    if mm is not None:
+        sheets["Meta Model"] = mm.export_results()[["Risk"]]
+    summary = export.summary_frame(sheets).drop(columns="Node")
+    summary.insert(0, "Scenario", name)
+    return summary
+
+
+def run_batch(scenarios, workers=None, simulations=10000, seed=42):
+    """
+    Runs scenarios across worker processes.
+
+    Returns:
+        - pd.DataFrame: One row per scenario and model, in input order
+    """
+    jobs = []
+    for i, scenario in enumerate(scenarios, start=1):
+        name, arguments = scenario_arguments(scenario, simulations, seed)
+        jobs.append((name or str(i), arguments))
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    ) as pool:
+        futures = [
+            pool.submit(run_scenario, name, arguments) for name, arguments in jobs
+        ]
+        frames = [future.result() for future in futures]
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run FAIR risk scenarios from a CSV or YAML file."
+    )
+    parser.add_argument("scenarios", help="CSV or YAML file of scenarios")
+    parser.add_argument(
+        "-o", "--output", default="summary.csv", help="CSV or Parquet summary path"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: all cores)",
+    )
+    parser.add_argument(
+        "-n", "--simulations", type=int, default=10000, help="Default simulation count"
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Default random seed")
+    args = parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenarios)
+    summary = run_batch(scenarios, args.workers, args.simulations, args.seed)
+    if Path(args.output).suffix.lower() == ".parquet":
+        summary.to_parquet(args.output, index=False)
+    else:
+        summary.to_csv(args.output, index=False)
+    failed = summary["Error"].notna().sum() if "Error" in summary else 0
+    print(f"Scored {len(scenarios)} scenarios ({failed} failed) -> {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
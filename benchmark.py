@@ -0,0 +1,432 @@
+"""
+Benchmarks for the calculate_risk pipeline.
+
+Runs every combination of use_tef/use_vuln/two_model/meta_model at each
+simulation count, timing each stage of the submit path and recording its
+peak traced memory. Results are written as JSON and can be compared against
+a saved baseline to catch regressions.
+
+With --startup it instead measures the app's cold start in fresh
+interpreters (importing main, the first script run and the warm-up) and
+the overhead of a rerun, and checks them against STARTUP_BUDGETS.
+
+Usage:
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json --tolerance 0.25
+    python benchmark.py -n 10000 100000 1000000 --stages models meta_model
+    python benchmark.py --startup
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+import pyfair
+
+import export
+from main import calculate_risk, create_fair_models
+
+# Defaults of the number_input grid in main.py, with LM in pounds
+DEFAULT_ARGS = {}
+for _suffix in ("1", "2"):
+    DEFAULT_ARGS.update(
+        {
+            f"lm_low_{_suffix}": 100000.0,
+            f"lm_mode_{_suffix}": 500000.0,
+            f"lm_high_{_suffix}": 1000000.0,
+            f"tef_low_{_suffix}": 0,
+            f"tef_mode_{_suffix}": 2,
+            f"tef_high_{_suffix}": 12,
+            f"contact_low_{_suffix}": 2,
+            f"contact_mode_{_suffix}": 5,
+            f"contact_high_{_suffix}": 20,
+            f"action_low_{_suffix}": 0.0,
+            f"action_mode_{_suffix}": 0.15,
+            f"action_high_{_suffix}": 0.2,
+            f"vuln_low_{_suffix}": 0.01,
+            f"vuln_mode_{_suffix}": 0.3,
+            f"vuln_high_{_suffix}": 0.5,
+            f"threat_low_{_suffix}": 0.5,
+            f"threat_mode_{_suffix}": 0.7,
+            f"threat_high_{_suffix}": 0.9,
+            f"control_low_{_suffix}": 0.75,
+            f"control_mode_{_suffix}": 0.8,
+            f"control_high_{_suffix}": 0.9,
+        }
+    )
+
+STAGES = (
+    "calculate_risk",
+    "models",
+    "meta_model",
+    "report_init",
+    "report_html",
+    "export_results",
+    "xlsx",
+)
+DEFAULT_SIMULATIONS = (10000, 50000, 100000)
+# Differences smaller than this are treated as timer noise
+MIN_REGRESSION_SECONDS = 0.05
+
+# Allowed seconds for each measure_startup metric
+STARTUP_BUDGETS = {
+    "import_main": 0.5,
+    "first_run": 1.0,
+    "rerun": 0.25,
+    "warm_up": 3.0,
+}
+RERUNS = 5
+
+# Run in a fresh interpreter; prints the startup timings as JSON. Streamlit
+# itself is imported first, as the server has already done that.
+_STARTUP_SCRIPT = """
+import json, statistics, sys, threading, time, warnings
+warnings.simplefilter("ignore")
+import streamlit
+from streamlit.testing.v1 import AppTest
+timings = {}
+if sys.argv[1] == "import":
+    started = time.perf_counter()
+    import main
+    timings["import_main"] = time.perf_counter() - started
+    import warmup
+    started = time.perf_counter()
+    warmup.warm_up()
+    timings["warm_up"] = time.perf_counter() - started
+else:
+    app = AppTest.from_file(sys.argv[2], default_timeout=120)
+    started = time.perf_counter()
+    app.run()
+    timings["first_run"] = time.perf_counter() - started
+    for thread in threading.enumerate():
+        if thread.name == "warm-up":
+            thread.join()
+    reruns = []
+    for _ in range(int(sys.argv[3])):
+        started = time.perf_counter()
+        app.run()
+        reruns.append(time.perf_counter() - started)
+    timings["rerun"] = statistics.median(reruns)
+print(json.dumps(timings))
+"""
+
+
+def _measure(func, repeat, trace_memory):
+    """
+    Times func over repeat runs and optionally traces one more for memory.
+
+    Returns:
+        - result: Return value of the last run
+        - seconds (float): Fastest wall time
+        - peak_bytes (int or None): Peak traced allocation above the start
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+    return result, min(timings), peak
+
+
+def run_case(
+    simulations,
+    use_tef,
+    use_vuln,
+    two_model,
+    meta_model,
+    stages=STAGES,
+    repeat=3,
+    trace_memory=True,
+):
+    """Benchmarks the selected stages for one configuration."""
+    flags = dict(
+        use_tef=use_tef, use_vuln=use_vuln, two_model=two_model, meta_model=meta_model
+    )
+    names = ["Risk Type 1", "Risk Type 2"] if two_model else ["Risk Type 1"]
+    rows = []
+
+    def stage(name, func):
+        """Runs func, measuring it if the stage was selected."""
+        if name not in stages:
+            return func()
+        result, seconds, peak = _measure(func, repeat, trace_memory)
+        rows.append(
+            {
+                "simulations": simulations,
+                **flags,
+                "stage": name,
+                "seconds": seconds,
+                "peak_bytes": peak,
+            }
+        )
+        return result
+
+    if "calculate_risk" in stages:
+        stage(
+            "calculate_risk",
+            lambda: calculate_risk(
+                simulations, use_cache=False, **flags, **DEFAULT_ARGS
+            ),
+        )
+
+    # Later stages consume earlier outputs, so these always run
+    models = stage(
+        "models",
+        lambda: create_fair_models(
+            names, use_tef, use_vuln, simulations, use_cache=False, **DEFAULT_ARGS
+        ),
+    )
+    if meta_model:
+
+        def build_meta_model():
+            mm = pyfair.FairMetaModel(name="Meta Model", models=models)
+            mm.calculate_all()
+            return mm
+
+        models = models + [stage("meta_model", build_meta_model)]
+
+    if "report_init" in stages or "report_html" in stages:
+        fsr = stage(
+            "report_init",
+            lambda: pyfair.FairSimpleReport(models, currency_prefix="GBP "),
+        )
+        if "report_html" in stages:
+            stage("report_html", lambda: export.report_html(fsr))
+
+    if "export_results" in stages or "xlsx" in stages:
+        labels = ["Model 1", "Model 2"][: len(names)] + ["Meta Model"]
+        sheets = stage(
+            "export_results",
+            lambda: {
+                label: model.export_results() for label, model in zip(labels, models)
+            },
+        )
+        if "xlsx" in stages:
+            stage("xlsx", lambda: export.simulation_xlsx(sheets))
+    return rows
+
+
+def run_benchmarks(
+    simulation_counts=DEFAULT_SIMULATIONS, stages=STAGES, repeat=3, trace_memory=True
+):
+    """
+    Benchmarks the full use_tef/use_vuln/two_model/meta_model matrix.
+
+    Returns:
+        - pd.DataFrame: One row per configuration and stage
+    """
+    rows = []
+    for simulations, flags in itertools.product(
+        simulation_counts, itertools.product((True, False), repeat=4)
+    ):
+        rows.extend(
+            run_case(
+                simulations,
+                *flags,
+                stages=stages,
+                repeat=repeat,
+                trace_memory=trace_memory,
+            )
+        )
+    return pd.DataFrame(rows)
+
+
+def measure_startup(repeat=3, reruns=RERUNS):
+    """
+    Times the app's cold start, each repetition in a fresh interpreter.
+
+    Metrics (the best of repeat runs each):
+        - import_main: importing main.py's modules
+        - warm_up: warmup.warm_up() after that import
+        - first_run: the first script run of main.py, imports included
+        - rerun: median of reruns further script runs once warm
+
+    Returns:
+        - pd.DataFrame: metric, seconds, budget and over_budget per metric
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = {}
+    for _ in range(repeat):
+        for args in (["import"], ["run", os.path.join(here, "main.py"), str(reruns)]):
+            output = subprocess.run(
+                [sys.executable, "-c", _STARTUP_SCRIPT, *args],
+                cwd=here,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            for metric, seconds in json.loads(output.splitlines()[-1]).items():
+                best[metric] = min(seconds, best.get(metric, np.inf))
+    return pd.DataFrame(
+        [
+            {
+                "metric": metric,
+                "seconds": best[metric],
+                "budget": budget,
+                "over_budget": best[metric] > budget,
+            }
+            for metric, budget in STARTUP_BUDGETS.items()
+        ]
+    )
+
+
+def environment():
+    """Describes the machine and library versions a benchmark ran on."""
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def case_key(row):
+    return (
+        int(row["simulations"]),
+        bool(row["use_tef"]),
+        bool(row["use_vuln"]),
+        bool(row["two_model"]),
+        bool(row["meta_model"]),
+        row["stage"],
+    )
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results with a baseline.
+
+    Returns:
+        - pd.DataFrame: Matching rows with baseline and current seconds,
+          their ratio, and whether the slowdown exceeds tolerance
+    """
+    previous = {case_key(row): row for row in baseline}
+    rows = []
+    for row in results.to_dict(orient="records"):
+        before = previous.get(case_key(row))
+        if before is None:
+            continue
+        ratio = row["seconds"] / before["seconds"] if before["seconds"] else np.inf
+        rows.append(
+            {
+                **{
+                    k: row[k]
+                    for k in (
+                        "simulations",
+                        "use_tef",
+                        "use_vuln",
+                        "two_model",
+                        "meta_model",
+                        "stage",
+                    )
+                },
+                "baseline_seconds": before["seconds"],
+                "seconds": row["seconds"],
+                "ratio": ratio,
+                "regression": ratio > 1 + tolerance
+                and row["seconds"] - before["seconds"] > MIN_REGRESSION_SECONDS,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the calculate_risk pipeline."
+    )
+    parser.add_argument(
+        "-n", "--simulations", type=int, nargs="+", default=list(DEFAULT_SIMULATIONS)
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per stage; the fastest is kept"
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="Skip the traced memory run"
+    )
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument(
+        "--save-baseline", metavar="PATH", help="Also write the results as a baseline"
+    )
+    parser.add_argument(
+        "--baseline", metavar="PATH", help="Baseline to compare against"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown before failing (0.25 = 25%%)",
+    )
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="Measure cold start and rerun overhead against STARTUP_BUDGETS instead",
+    )
+    args = parser.parse_args(argv)
+    warnings.simplefilter(action="ignore", category=FutureWarning)
+
+    if args.startup:
+        startup = measure_startup(args.repeat)
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "environment": environment(),
+                    "startup": startup.to_dict(orient="records"),
+                },
+                f,
+                indent=2,
+            )
+        print(startup.to_string(index=False))
+        return 1 if startup["over_budget"].any() else 0
+
+    results = run_benchmarks(
+        args.simulations, args.stages, args.repeat, not args.no_memory
+    )
+    document = {
+        "environment": environment(),
+        "results": results.to_dict(orient="records"),
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(document, f, indent=2)
+
+    summary = results.groupby(["simulations", "stage"])[["seconds", "peak_bytes"]].max()
+    print(summary.to_string())
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        comparison = compare(results, baseline, args.tolerance)
+        regressions = (
+            comparison[comparison["regression"]] if len(comparison) else comparison
+        )
+        if len(regressions):
+            print("\nRegressions:")
+            print(regressions.to_string(index=False))
+            return 1
+        print(
+            f"\nNo regressions against {args.baseline} ({len(comparison)} stages compared)."
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
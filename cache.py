@@ -0,0 +1,100 @@
+"""Content-addressed, bounded LRU cache for calculated risk results.
+
+The cache lives at module level so that it is created once per server
+process and shared by every Streamlit session (Streamlit re-executes
+main.py on each rerun, but imported modules persist).
+"""
+
+import hashlib
+import json
+import numbers
+import threading
+from collections import OrderedDict
+
+
+def _canonical(value):
+    """Normalise a parameter value so equal inputs hash identically."""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    # numbers.Real also covers NumPy scalars, e.g. from pandas or st.data_editor
+    if isinstance(value, numbers.Real):
+        return float(value)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return str(value)
+
+
+def make_key(**params):
+    """Returns a SHA-256 hex digest identifying a set of calculation parameters."""
+    payload = json.dumps(_canonical(params), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache bounded by entry count and approximate size.
+
+    Each entry is stored with a caller-supplied size in bytes. When either
+    limit is exceeded the least recently used entries are evicted.
+    """
+
+    def __init__(self, max_entries=32, max_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def nbytes(self):
+        """Approximate number of bytes currently held."""
+        return self._nbytes
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, marking it most recently used."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key, value, nbytes=0):
+        """Stores value under key and evicts old entries to respect the limits."""
+        with self._lock:
+            if key in self._entries:
+                self._nbytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+            while (
+                len(self._entries) > self.max_entries or self._nbytes > self.max_bytes
+            ):
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_nbytes
+
+    def clear(self):
+        """Removes every entry and resets the hit/miss counters."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+RESULT_CACHE = ResultCache()
+# Individual FairModels, shared with the RESULT_CACHE entries that contain them
+MODEL_CACHE = ResultCache(max_entries=64)
+EXPORT_CACHE = ResultCache(max_entries=64, max_bytes=256 * 1024 * 1024)
@@ -0,0 +1,542 @@
+"""
+Vectorized NumPy implementation of the FAIR calculation tree.
+
+pyfair's FairModel generates each node into a pandas DataFrame and walks its
+dependency tree node by node. This module computes the same tree with batched
+Beta-PERT draws written into one contiguous float64 matrix, then hands the
+result back to pyfair as an ordinary FairModel so reporting is unchanged.
+
+For a fixed seed the draws are bit-identical to pyfair: inputs are sampled in
+the order supplied from a legacy ``np.random.RandomState`` (which is what
+``FairModel`` seeds and scipy's ``beta.rvs`` consumes), using the same PERT
+parameterization and clipping rules.
+"""
+
+import functools
+import os
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import scipy.special
+
+# Column order of FairModel.export_results()
+COLUMNS = [
+    "Risk",
+    "Loss Event Frequency",
+    "Threat Event Frequency",
+    "Vulnerability",
+    "Contact Frequency",
+    "Probability of Action",
+    "Threat Capability",
+    "Control Strength",
+    "Loss Magnitude",
+    "Primary Loss",
+    "Secondary Loss",
+    "Secondary Loss Event Frequency",
+    "Secondary Loss Event Magnitude",
+]
+
+# Targets whose inputs and draws must lie between zero and one
+LE_1_TARGETS = (
+    "Probability of Action",
+    "Vulnerability",
+    "Control Strength",
+    "Threat Capability",
+)
+
+PERT_GAMMA = 4
+# Storage type of compact result tables
+COMPACT_DTYPE = np.float32
+
+
+# Ways of drawing the inputs' uniforms. Monte Carlo reproduces pyfair's own
+# draws; inverse CDF draws independent uniforms too, but maps them through
+# the tabulated inverse CDF (pert_ppf), which is faster; the stratified
+# samplers spread the draws more evenly over the input space.
+MONTE_CARLO = "Monte Carlo"
+INVERSE_CDF = "Monte Carlo (inverse CDF)"
+LATIN_HYPERCUBE = "Latin hypercube"
+SOBOL = "Sobol"
+SAMPLERS = (MONTE_CARLO, INVERSE_CDF, LATIN_HYPERCUBE, SOBOL)
+STRATIFIED = (LATIN_HYPERCUBE, SOBOL)
+# Independently randomized blocks of a Latin hypercube or Sobol sample, whose
+# spread gives its standard error
+REPLICATES = 8
+
+
+def _fair_exception(message):
+    """
+    pyfair's FairException for message.
+
+    pyfair pulls in matplotlib and scipy.stats, the bulk of the app's cold
+    start, so this module imports it on first use (see warmup).
+    """
+    from pyfair.utility.fair_exception import FairException
+
+    return FairException(message)
+
+
+def compact_results():
+    """Whether results are kept compactly by default: PYFAIR_COMPACT_RESULTS."""
+    return os.environ.get("PYFAIR_COMPACT_RESULTS", "").lower() in ("1", "true", "yes")
+
+
+def model_seed(random_seed, index):
+    """
+    Derives an independent RandomState seed for the index-th model of a run.
+
+    Each model gets its own stream spawned from the run seed, so models are
+    not correlated through shared draws and adding a model never changes
+    the draws of the models before it.
+    """
+    sequence = np.random.SeedSequence(random_seed, spawn_key=(index,))
+    return int(sequence.generate_state(1)[0])
+
+
+class SimulationResult:
+    """
+    Simulated node values for one model, stored row-wise in a single matrix.
+
+    ``values[i]`` holds the draws for ``columns[i]``; ``calculated`` lists the
+    nodes derived from their children rather than supplied as inputs.
+    """
+
+    def __init__(self, columns, values, calculated=()):
+        self.columns = list(columns)
+        self.values = values
+        self.calculated = list(calculated)
+
+    def __getitem__(self, column):
+        return self.values[self.columns.index(column)]
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    @property
+    def n_simulations(self):
+        return self.values.shape[1]
+
+    def to_frame(self, compact=False):
+        """
+        Returns the results laid out like FairModel.export_results().
+
+        A compact frame holds only the simulated nodes, as one contiguous
+        float32 block that column access and exports view without copying.
+        That takes under a fifth of the memory of the full table (13 float64
+        columns, unused ones NaN) and keeps about seven significant digits,
+        ample for reporting.
+        """
+        if compact:
+            columns = [column for column in COLUMNS if column in self]
+            values = np.empty((len(columns), self.n_simulations), dtype=COMPACT_DTYPE)
+            for row, column in zip(values, columns):
+                row[:] = self[column]
+            return pd.DataFrame(values.T, columns=columns, copy=False)
+        missing = np.full(self.n_simulations, np.nan)
+        data = {
+            column: self[column] if column in self else missing for column in COLUMNS
+        }
+        return pd.DataFrame(data, columns=COLUMNS)
+
+
+def pert_parameters(low, mode, high, gamma=PERT_GAMMA):
+    """Returns the (alpha, beta) shape parameters of a Beta-PERT distribution."""
+    mean = (low + gamma * mode + high) / (gamma + 2)
+    stdev = (high - low) / (gamma + 2)
+    alpha = ((mean - low) / (high - low)) * (
+        (mean - low) * (high - mean) / (stdev**2) - 1
+    )
+    beta = alpha * (high - mean) / (mean - low)
+    return alpha, beta
+
+
+def check_inputs(target, low, mode, high):
+    """Raises FairException for parameters pyfair would reject."""
+    for keyword, value in (("low", low), ("mode", mode), ("high", high)):
+        if value is None:
+            raise _fair_exception(f'"{target}" is missing "{keyword}".')
+        if value < 0:
+            raise _fair_exception(f'"{keyword}" is less than zero.')
+        if target in LE_1_TARGETS and not 0.0 <= value <= 1.0:
+            raise _fair_exception(
+                f'"{target}" must have "{keyword}" value between zero and one.'
+            )
+    if mode < low:
+        raise _fair_exception(f'"{target}" fails PERT requirement "mode >= low".')
+    if high < mode:
+        raise _fair_exception(f'"{target}" fails PERT requirement "high >= mode".')
+    if high - low <= 0:
+        raise _fair_exception('"low" value must be less than "high" value.')
+
+
+def draw_pert(random_state, target, low, mode, high, size, out=None):
+    """Draws clipped Beta-PERT variates for a node into out (or a new array)."""
+    check_inputs(target, low, mode, high)
+    alpha, beta = pert_parameters(low, mode, high)
+    draws = random_state.beta(alpha, beta, size)
+    if out is None:
+        out = draws
+    else:
+        out[...] = draws
+    out *= high - low
+    out += low
+    upper = 1.0 if target in LE_1_TARGETS else np.inf
+    np.clip(out, 0.0, upper, out=out)
+    return out
+
+
+# Chebyshev-spaced probabilities, dense in both tails where the PERT
+# inverse CDF bends most sharply.
+PPF_GRID_SIZE = 4096
+PPF_GRID = 0.5 * (1 - np.cos(np.pi * np.arange(PPF_GRID_SIZE + 1) / PPF_GRID_SIZE))
+# Grid intervals at each end whose draws are evaluated exactly rather than
+# interpolated. The inverse CDF is steepest there (its slope is infinite at
+# 0 or 1), and they hold only about 7.5e-5 of all draws.
+PPF_EXACT_TAIL = 16
+# Largest error of pert_ppf as a share of high - low. Measured as 2.6e-5 at
+# 32 points per grid interval over the whole family pert_parameters gives
+# (mode from low to high, i.e. alpha from 0.67 to 4.67); without the exact
+# tails it would be 1.2e-2, in the outermost intervals.
+PPF_MAX_ERROR = 5e-5
+
+
+@functools.lru_cache(maxsize=1024)
+def ppf_table(alpha, beta):
+    """
+    Inverse CDF of Beta(alpha, beta) on PPF_GRID.
+
+    Evaluating the inverse is the costly part of inverse-CDF sampling, so
+    tables are memoized per shape pair (32 KB each) and returned read-only.
+    """
+    table = scipy.special.betaincinv(alpha, beta, PPF_GRID)
+    table.flags.writeable = False
+    return table
+
+
+@functools.lru_cache(maxsize=1024)
+def pert_table(target, low, mode, high):
+    """
+    Inverse CDF of a node's Beta-PERT distribution on PPF_GRID, in node units.
+
+    The input checks, the PERT parameterization, the scaling to low..high
+    and draw_pert's clipping are done once per (target, low, mode, high)
+    rather than on every draw, so inputs repeated across models, scenarios
+    or sensitivity cases only pay for the interpolation. The table is
+    read-only and shares its ppf_table with any triple of the same shape.
+
+    Returns:
+        - table (np.ndarray): Node values at PPF_GRID
+        - alpha, beta (float): Shape parameters, for exact tail draws
+    """
+    check_inputs(target, low, mode, high)
+    alpha, beta = (float(v) for v in pert_parameters(low, mode, high))
+    table = ppf_table(alpha, beta) * (high - low)
+    table += low
+    upper = 1.0 if target in LE_1_TARGETS else np.inf
+    np.clip(table, 0.0, upper, out=table)
+    table.flags.writeable = False
+    return table, alpha, beta
+
+
+def replicate_sizes(n_simulations, replicates=REPLICATES):
+    """Sizes of the contiguous replicate blocks of a stratified sample."""
+    return [
+        len(block) for block in np.array_split(np.arange(n_simulations), replicates)
+    ]
+
+
+def sample_uniforms(sampler, n_dims, n_simulations, random_seed=42):
+    """
+    Draws uniforms for n_dims inputs for the inverse-CDF samplers.
+
+    INVERSE_CDF draws them independently. A Latin hypercube or Sobol
+    sample is made of REPLICATES contiguous blocks, each an independent
+    randomization (its own scrambling or permutation) of the design, so the
+    block means of any output are independent estimates (see
+    summary.ale_summary). Sobol block sizes are rarely powers of two; the
+    points lose some balance, which is still far better than Monte Carlo.
+
+    Returns:
+        - np.ndarray: (n_dims, n_simulations) uniforms in (0, 1)
+    """
+    if sampler == INVERSE_CDF:
+        return np.random.default_rng(random_seed).random((n_dims, n_simulations))
+    from scipy.stats import qmc
+
+    designs = {LATIN_HYPERCUBE: qmc.LatinHypercube, SOBOL: qmc.Sobol}
+    if sampler not in designs:
+        raise _fair_exception(f'Unknown sampler "{sampler}".')
+    uniforms = np.empty((n_dims, n_simulations))
+    start = 0
+    for block, size in enumerate(replicate_sizes(n_simulations)):
+        design = designs[sampler](
+            n_dims, seed=np.random.default_rng(model_seed(random_seed, block))
+        )
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            uniforms[:, start : start + size] = design.random(size).T
+        start += size
+    # Scrambled Sobol points can be exactly zero
+    return np.clip(uniforms, np.finfo(float).tiny, 1.0, out=uniforms)
+
+
+def ppf_positions(uniforms):
+    """
+    Locates uniforms on PPF_GRID for interpolation.
+
+    Chebyshev spacing lets the bracketing grid index be computed directly
+    rather than searched for. The positions depend only on the uniforms, so
+    they can be computed once and reused for any parameters.
+
+    Returns:
+        - index (np.ndarray): Lower bracketing grid index of each uniform
+        - weight (np.ndarray): Linear interpolation weight within the bracket
+        - tail (tuple): np.nonzero of the uniforms in the PPF_EXACT_TAIL
+          intervals at either end
+    """
+    index = np.arccos(1 - 2 * np.asarray(uniforms, dtype=np.float64))
+    index *= PPF_GRID_SIZE / np.pi
+    index = np.minimum(index.astype(np.intp), PPF_GRID_SIZE - 1)
+    lower = PPF_GRID[index]
+    weight = (uniforms - lower) / (PPF_GRID[index + 1] - lower)
+    tail = np.nonzero(
+        (index < PPF_EXACT_TAIL) | (index >= PPF_GRID_SIZE - PPF_EXACT_TAIL)
+    )
+    return index, np.clip(weight, 0.0, 1.0, out=weight), tail
+
+
+def _exact_ppf(target, uniforms, lows, highs, alphas, betas):
+    """Beta-PERT inverse CDF evaluated exactly, for the few tail draws."""
+    values = scipy.special.betaincinv(alphas, betas, uniforms)
+    values *= highs - lows
+    values += lows
+    upper = 1.0 if target in LE_1_TARGETS else np.inf
+    return np.clip(values, 0.0, upper, out=values)
+
+
+def pert_ppf(uniforms, target, low, mode, high, positions=None):
+    """
+    Maps uniform variates onto a node's Beta-PERT distribution.
+
+    Inverse-CDF sampling lets the same uniforms be reused under different
+    parameters (common random numbers), so differences between runs reflect
+    the parameters rather than sampling noise. The exact inverse is
+    tabulated on PPF_GRID (see pert_table) and interpolated linearly, which
+    is far cheaper than evaluating it per draw, except in the steep tails;
+    the error is below PPF_MAX_ERROR of the high - low range. Pass positions
+    from ppf_positions to skip locating the uniforms again.
+    """
+    table, alpha, beta = pert_table(target, low, mode, high)
+    uniforms = np.asarray(uniforms, dtype=np.float64)
+    index, weight, tail = ppf_positions(uniforms) if positions is None else positions
+    lower = table[index]
+    values = table[index + 1] - lower
+    values *= weight
+    values += lower
+    values[tail] = _exact_ppf(target, uniforms[tail], low, high, alpha, beta)
+    return values
+
+
+def pert_ppf_rows(uniforms, target, lows, modes, highs, positions=None):
+    """
+    pert_ppf for many parameter sets at once.
+
+    Row i of uniforms is mapped through the Beta-PERT inverse CDF with
+    parameters lows[i], modes[i], highs[i]. The lookups for all rows run as
+    a single gather over their stacked tables, with the same accuracy as
+    pert_ppf.
+    """
+    tables, alphas, betas = zip(
+        *(pert_table(target, *params) for params in zip(lows, modes, highs))
+    )
+    uniforms = np.asarray(uniforms, dtype=np.float64)
+    index, weight, tail = ppf_positions(uniforms) if positions is None else positions
+    # Offset each row's indices into its own table within the flattened array
+    index = index + (np.arange(len(tables)) * (PPF_GRID_SIZE + 1))[:, None]
+    table = np.concatenate(tables)
+    lower = table[index]
+    values = table[index + 1] - lower
+    values *= weight
+    values += lower
+    rows = tail[0]
+    values[tail] = _exact_ppf(
+        target,
+        uniforms[tail],
+        *(np.asarray(v, dtype=np.float64)[rows] for v in (lows, highs, alphas, betas)),
+    )
+    return values
+
+
+def risk_from_inputs(values):
+    """
+    Evaluates the FAIR tree for Risk alone from a dict of input node arrays.
+
+    Threat Event Frequency and Vulnerability are derived from their children
+    when not supplied, exactly as in simulate_model. Arrays may hold one
+    model per row, in which case the derived Vulnerability is per row.
+    """
+    tef = values.get("Threat Event Frequency")
+    if tef is None:
+        tef = values["Contact Frequency"] * values["Probability of Action"]
+    vulnerability = values.get("Vulnerability")
+    if vulnerability is None:
+        vulnerability = np.mean(
+            values["Control Strength"] < values["Threat Capability"],
+            axis=-1,
+            keepdims=True,
+        )
+    return tef * vulnerability * values["Loss Magnitude"]
+
+
+def model_layout(inputs):
+    """
+    Validates the input nodes of a model and works out its result layout.
+
+    Returns:
+        - columns (list): Result rows in FairModel column order
+        - calculated (list): Nodes derived from their children
+    """
+    frequency = (
+        ["Threat Event Frequency"]
+        if "Threat Event Frequency" in inputs
+        else ["Contact Frequency", "Probability of Action"]
+    )
+    vulnerability = (
+        ["Vulnerability"]
+        if "Vulnerability" in inputs
+        else ["Threat Capability", "Control Strength"]
+    )
+    required = ["Loss Magnitude"] + frequency + vulnerability
+    for target in required:
+        if target not in inputs:
+            raise _fair_exception(f'Missing input for "{target}".')
+    for target in inputs:
+        if target not in required:
+            raise _fair_exception(f'Unsupported input "{target}".')
+
+    calculated = ["Risk", "Loss Event Frequency"]
+    if "Threat Event Frequency" not in inputs:
+        calculated.append("Threat Event Frequency")
+    if "Vulnerability" not in inputs:
+        calculated.append("Vulnerability")
+    columns = [c for c in COLUMNS if c in inputs or c in calculated]
+    return columns, calculated
+
+
+def simulate_model(
+    inputs,
+    n_simulations,
+    random_seed=42,
+    out=None,
+    vulnerability=None,
+    sampler=MONTE_CARLO,
+):
+    """
+    Simulates a FAIR model from Beta-PERT inputs.
+
+    Parameters:
+        - inputs (dict): Maps node names to dicts with low/mode/high. Must give
+          Loss Magnitude, Threat Event Frequency or Contact Frequency and
+          Probability of Action, and Vulnerability or Threat Capability and
+          Control Strength. Draw order follows the dict order.
+        - n_simulations (int): Number of draws per node
+        - random_seed (int): Seed for the legacy NumPy RandomState
+        - out (np.ndarray): Optional (len(columns), n_simulations) float64
+          buffer to write into, e.g. a view onto shared memory
+        - vulnerability (float): Optional fixed value for a Vulnerability
+          derived from Threat Capability and Control Strength, used when the
+          step average is taken over more draws than this call makes
+        - sampler (str): One of SAMPLERS. All but MONTE_CARLO map
+          sample_uniforms through pert_ppf instead of drawing like pyfair.
+
+    Returns:
+        - SimulationResult: Supplied and calculated node values
+    """
+    columns, calculated = model_layout(inputs)
+    shape = (len(columns), n_simulations)
+    if out is None:
+        out = np.empty(shape, dtype=np.float64)
+    elif out.shape != shape:
+        raise _fair_exception(f"Output buffer has shape {out.shape}, expected {shape}.")
+    result = SimulationResult(columns, out, calculated)
+
+    if sampler == MONTE_CARLO:
+        random_state = np.random.RandomState(random_seed)
+        for target, params in inputs.items():
+            draw_pert(
+                random_state,
+                target,
+                params.get("low"),
+                params.get("mode"),
+                params.get("high"),
+                n_simulations,
+                out=result[target],
+            )
+    else:
+        uniforms = sample_uniforms(sampler, len(inputs), n_simulations, random_seed)
+        for row, (target, params) in zip(uniforms, inputs.items()):
+            result[target][...] = pert_ppf(
+                row, target, params.get("low"), params.get("mode"), params.get("high")
+            )
+
+    return derive_nodes(result, vulnerability)
+
+
+def derive_nodes(result, vulnerability=None):
+    """
+    Computes the calculated nodes of a result from its supplied inputs, in place.
+
+    A derived Vulnerability is the share of all the result's draws where
+    Threat Capability exceeds Control Strength, unless given.
+
+    Returns:
+        - SimulationResult: result, for chaining
+    """
+    calculated = result.calculated
+    if "Threat Event Frequency" in calculated:
+        np.multiply(
+            result["Contact Frequency"],
+            result["Probability of Action"],
+            out=result["Threat Event Frequency"],
+        )
+    if "Vulnerability" in calculated:
+        # pyfair treats vulnerability as the share of draws where TCap > CS
+        if vulnerability is None:
+            vulnerability = np.mean(
+                result["Control Strength"] < result["Threat Capability"]
+            )
+        result["Vulnerability"].fill(vulnerability)
+    np.multiply(
+        result["Threat Event Frequency"],
+        result["Vulnerability"],
+        out=result["Loss Event Frequency"],
+    )
+    np.multiply(
+        result["Loss Event Frequency"], result["Loss Magnitude"], out=result["Risk"]
+    )
+    return result
+
+
+def to_fair_model(name, inputs, result, random_seed=42, compact=False):
+    """
+    Wraps a SimulationResult in a calculated FairModel.
+
+    pyfair has no public hook for attaching precomputed results, so the
+    model's parameter record, dependency tree and result table are populated
+    directly, mirroring what FairModel.input_data and calculate_all do.
+    With compact, the table is the compact form of SimulationResult.to_frame.
+    """
+    from pyfair import FairModel
+
+    model = FairModel(
+        name=name, n_simulations=result.n_simulations, random_seed=random_seed
+    )
+    for target, params in inputs.items():
+        model._data_input._supplied_values[target] = {**params, "gamma": PERT_GAMMA}
+        model._tree.update_status(target, "Supplied")
+    for target in reversed(result.calculated):
+        model._tree.update_status(target, "Calculated")
+    model._model_table = result.to_frame(compact=compact)
+    return model
@@ -0,0 +1,263 @@
+"""
+In-memory rendering of reports and simulation exports.
+
+Everything is produced as bytes for st.download_button, so nothing is
+written to the working directory and concurrent sessions cannot overwrite
+each other's files. Rendered outputs are cached per result hash.
+"""
+
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import metrics
+from cache import EXPORT_CACHE
+
+
+def cached_export(key, fmt, build):
+    """
+    Returns the bytes for an export of a result, building them at most once.
+
+    Parameters:
+        - key (str): Result hash from risk_cache_key
+        - fmt (str): Export format name, e.g. "html" or "xlsx"
+        - build (callable): Zero-argument function producing the bytes
+    """
+    data = EXPORT_CACHE.get((key, fmt))
+    if data is None:
+        with metrics.stage("export", format=fmt):
+            data = build()
+        EXPORT_CACHE.put((key, fmt), data, nbytes=len(data))
+    return data
+
+
+def is_cached(key, fmt):
+    """Whether an export of the given result and format is already built."""
+    return (key, fmt) in EXPORT_CACHE
+
+
+# pyfair draws its report charts through pyplot, whose global state is not
+# thread-safe, so background renders run one at a time on a single thread.
+_background = None
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def submit_export(key, fmt, build):
+    """
+    Starts building an export on the background render thread.
+
+    The request thread returns immediately. Submitting a build that is
+    already queued or running returns the existing future, so each export
+    is rendered at most once however many sessions ask for it.
+
+    Returns:
+        - Future: Resolves to the export bytes, which are also cached
+    """
+    global _background
+    with _pending_lock:
+        future = _pending.get((key, fmt))
+        if future is None:
+            if _background is None:
+                _background = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="export"
+                )
+            future = _background.submit(cached_export, key, fmt, build)
+            _pending[(key, fmt)] = future
+            future.add_done_callback(lambda _: _forget(key, fmt))
+    return future
+
+
+def _forget(key, fmt):
+    with _pending_lock:
+        _pending.pop((key, fmt), None)
+
+
+def pending_export(key, fmt):
+    """The future of a background build still queued or running, or None."""
+    return _pending.get((key, fmt))
+
+
+def report_html(fsr):
+    """
+    Renders a FairSimpleReport to HTML bytes.
+
+    FairSimpleReport.to_html only writes to a path; _construct_output is the
+    method it uses to build the document.
+    """
+    return fsr._construct_output().encode("utf-8")
+
+
+# Rows per worksheet in Excel, header included
+EXCEL_MAX_ROWS = 1_048_576
+# Longest worksheet name Excel accepts
+EXCEL_MAX_SHEET_NAME = 31
+# Rows converted from a DataFrame to Python values at a time
+XLSX_CHUNK_ROWS = 10_000
+
+
+def simulation_xlsx(sheets, max_rows=EXCEL_MAX_ROWS):
+    """
+    Writes a {sheet name: DataFrame} mapping to XLSX bytes.
+
+    The workbook is written in xlsxwriter's constant_memory mode, which
+    flushes each row to a temporary file once the next one starts, instead
+    of holding every cell until the workbook is closed as pd.ExcelWriter
+    does. Rows are taken from the DataFrames XLSX_CHUNK_ROWS at a time, so
+    apart from the compressed result, memory stays flat however many rows
+    there are. A DataFrame too long for one worksheet continues on
+    "<name> (2)", "<name> (3)", ..., each with its own header row.
+    """
+    # Imported here rather than at the top to keep it off the cold start
+    import xlsxwriter
+
+    # Zipped into a temporary file, so the result is only held once, as the
+    # returned bytes
+    with tempfile.TemporaryFile() as output:
+        workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+        header = workbook.add_format({"bold": True, "border": 1, "align": "center"})
+        part_rows = max_rows - 1
+        for sheet_name, df in sheets.items():
+            for part, start in enumerate(range(0, max(len(df), 1), part_rows), start=1):
+                worksheet = workbook.add_worksheet(_part_name(sheet_name, part))
+                worksheet.write_row(
+                    0, 0, [str(column) for column in df.columns], header
+                )
+                _write_rows(worksheet, df, start, min(start + part_rows, len(df)))
+        workbook.close()
+        output.seek(0)
+        return output.read()
+
+
+def _part_name(sheet_name, part):
+    """Worksheet name of the part-th worksheet of a sheet, within Excel's 31 characters."""
+    suffix = f" ({part})" if part > 1 else ""
+    return sheet_name[: EXCEL_MAX_SHEET_NAME - len(suffix)].rstrip() + suffix
+
+
+def _write_rows(worksheet, df, start, stop):
+    """Writes rows start:stop of df below the header, leaving missing values blank."""
+    numeric = [
+        pd.api.types.is_float_dtype(dtype) or pd.api.types.is_integer_dtype(dtype)
+        for dtype in df.dtypes
+    ]
+    writers = [
+        worksheet.write_number if is_number else worksheet.write
+        for is_number in numeric
+    ]
+    row = 1
+    for chunk in range(start, stop, XLSX_CHUNK_ROWS):
+        end = min(chunk + XLSX_CHUNK_ROWS, stop)
+        columns = []
+        for i, is_number in enumerate(numeric):
+            values = df.iloc[chunk:end, i]
+            if not is_number:
+                values = values.astype(object).where(values.notna(), None)
+            columns.append(values.tolist())
+        for values in zip(*columns):
+            for column, (write, value) in enumerate(zip(writers, values)):
+                # NaN != NaN, so this skips NaN and None alike
+                if value is not None and value == value:
+                    write(row, column, value)
+            row += 1
+
+
+SUMMARY_QUANTILES = (0.05, 0.5, 0.9, 0.95, 0.99)
+
+
+def summary_frame(sheets):
+    """Descriptive statistics for every populated column of every sheet."""
+    rows = []
+    for sheet_name, df in sheets.items():
+        df = df.dropna(axis=1, how="all")
+        quantiles = df.quantile(list(SUMMARY_QUANTILES))
+        for column in df.columns:
+            row = {
+                "Model": sheet_name,
+                "Node": column,
+                "Simulations": int(df[column].count()),
+                "Mean": df[column].mean(),
+                "Stdev": df[column].std(),
+                "Minimum": df[column].min(),
+            }
+            for q in SUMMARY_QUANTILES:
+                row[f"P{q * 100:g}"] = quantiles.at[q, column]
+            row["Maximum"] = df[column].max()
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def summary_xlsx(sheets):
+    """Writes only the summary statistics of each sheet to a one-sheet XLSX."""
+    return simulation_xlsx({"Summary": summary_frame(sheets)})
+
+
+def _archive(sheets, extension, write):
+    """
+    Zips one file per sheet, each written by write(df, buffer).
+
+    Unused node columns (all NaN) are dropped. The members are already
+    compressed, so they are stored rather than deflated again.
+    """
+    output = BytesIO()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as archive:
+        for sheet_name, df in sheets.items():
+            buffer = BytesIO()
+            write(df.dropna(axis=1, how="all").reset_index(drop=True), buffer)
+            archive.writestr(f"{sheet_name}.{extension}", buffer.getvalue())
+    return output.getvalue()
+
+
+def simulation_parquet(sheets):
+    """Zip of one zstd-compressed Parquet file per sheet."""
+    return _archive(
+        sheets,
+        "parquet",
+        lambda df, buffer: df.to_parquet(buffer, compression="zstd", index=False),
+    )
+
+
+def simulation_csv(sheets):
+    """Zip of one gzip-compressed CSV file per sheet."""
+    return _archive(
+        sheets,
+        "csv.gz",
+        lambda df, buffer: df.to_csv(
+            buffer, index=False, compression={"method": "gzip", "compresslevel": 6}
+        ),
+    )
+
+
+def simulation_arrow(sheets):
+    """Zip of one zstd-compressed Arrow IPC (Feather v2) file per sheet."""
+    return _archive(
+        sheets,
+        "arrow",
+        lambda df, buffer: feather.write_feather(
+            pa.Table.from_pandas(df, preserve_index=False), buffer, compression="zstd"
+        ),
+    )
+
+
+# Download label -> (builder, file name, MIME type)
+EXPORT_FORMATS = {
+    "XLSX": (
+        simulation_xlsx,
+        "output.xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+    "XLSX (summary only)": (
+        summary_xlsx,
+        "summary.xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+    "Parquet": (simulation_parquet, "output_parquet.zip", "application/zip"),
+    "CSV (gzip)": (simulation_csv, "output_csv.zip", "application/zip"),
+    "Arrow IPC": (simulation_arrow, "output_arrow.zip", "application/zip"),
+}
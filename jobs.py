@@ -0,0 +1,220 @@
+"""
+Background execution of calculations on a bounded worker pool.
+
+Streamlit reruns the whole script on every widget interaction, so a long
+calculate_risk call on the script thread freezes the session and is thrown
+away by the next click. Instead the app submits a job here, keeps only the
+job id in session state, and picks the result up on a later rerun. Sessions
+release a job once they have its outcome, and a finished job is forgotten
+(along with its result) as soon as no session is waiting on it, or after
+JOB_TTL if its sessions went away without collecting it.
+
+Jobs report progress through the callable passed to their function, which
+is also where cancellation takes effect: once a job is cancelled, its next
+progress report raises Cancelled and the worker moves on. Identical jobs
+(same key) submitted by several sessions share one run, which is only
+cancelled once every session has released it.
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# Finished jobs are kept this long (seconds) for their sessions to collect
+JOB_TTL = 600
+# How often (seconds) a waiting session reruns to check on its job
+POLL_INTERVAL = 0.5
+
+
+class Cancelled(Exception):
+    """Raised inside a job when it has been cancelled."""
+
+
+def max_workers():
+    """Worker threads for jobs: PYFAIR_JOB_WORKERS, else up to four."""
+    configured = os.environ.get("PYFAIR_JOB_WORKERS")
+    if configured:
+        return max(int(configured), 1)
+    return min(4, os.cpu_count() or 1)
+
+
+class Job:
+    """State of one submitted calculation, shared with the sessions awaiting it."""
+
+    def __init__(self, key, owner):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.owners = {owner}
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Queued"
+        self.result = None
+        self.error = None
+        self.trace = []
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def report(self, fraction, message=None):
+        """Records progress from inside the job; raises Cancelled if cancelled."""
+        if self._cancel.is_set():
+            raise Cancelled()
+        self.progress = min(max(float(fraction), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+
+class JobManager:
+    """Runs jobs on a fixed-size thread pool and tracks them by id."""
+
+    def __init__(self, workers=None, ttl=JOB_TTL):
+        self.workers = workers or max_workers()
+        self.ttl = ttl
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="job"
+        )
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def submit(self, key, func, owner):
+        """
+        Queues func(report) as a job, or joins an identical active job.
+
+        Parameters:
+            - key (str): Identifies the work, e.g. a result hash
+            - func (callable): Called with the job's report method; its
+              return value becomes job.result
+            - owner (str): Session waiting for the result
+
+        Returns:
+            - Job
+        """
+        with self._lock:
+            self._prune()
+            job = self._active.get(key)
+            if job is not None and not job.cancelled:
+                job.owners.add(owner)
+                return job
+            job = Job(key, owner)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            job.future = self._pool.submit(self._run, job, func)
+        return job
+
+    def get(self, job_id):
+        """The job with this id, or None if unknown or expired."""
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def release(self, job_id, owner):
+        """
+        Stops owner waiting on a job, cancelling it if nobody else is.
+
+        Call it once the job's outcome has been collected too: a finished
+        job nobody is waiting on is forgotten, freeing its result.
+
+        Returns:
+            - bool: Whether the job was cancelled
+        """
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.owners.discard(owner)
+            if job.owners:
+                return False
+            if job.done:
+                del self._jobs[job_id]
+                return False
+            self._cancel(job)
+        return True
+
+    def cancel(self, job_id):
+        """Cancels a job for every session waiting on it."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.done:
+                self._cancel(job)
+
+    def _cancel(self, job):
+        job._cancel.set()
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+        if job.future.cancel():
+            # Never started, so _run will not record the outcome
+            self._finish(job, CANCELLED, "Cancelled")
+
+    def _run(self, job, func):
+        job.started = time.time()
+        job.status = RUNNING
+        job.message = "Running"
+        with metrics.trace() as job.trace:
+            try:
+                job.report(0.0)
+                job.result = func(job.report)
+            except Cancelled:
+                self._finish(job, CANCELLED, "Cancelled")
+            except Exception as e:
+                job.error = e
+                self._finish(job, FAILED, str(e))
+            else:
+                job.progress = 1.0
+                self._finish(job, DONE, "Done")
+        with self._lock:
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+        metrics.record("job_queued", job.started - job.created)
+        metrics.record("job", job.finished - job.started, status=job.status)
+
+    def _finish(self, job, status, message):
+        job.status = status
+        job.message = message
+        job.finished = time.time()
+
+    def _prune(self):
+        """Forgets finished jobs older than the TTL. Caller holds the lock."""
+        cutoff = time.time() - self.ttl
+        for job_id in [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.done and job.finished < cutoff
+        ]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        """Cancels all outstanding jobs and stops the pool."""
+        with self._lock:
+            for job in list(self._jobs.values()):
+                if not job.done:
+                    self._cancel(job)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+JOBS = JobManager()
@@ -0,0 +1,480 @@
+"""
+Load test of the Streamlit app with many concurrent sessions.
+
+Starts main.py on a local Streamlit server (or targets a running one given
+with --url) and connects simulated browser sessions to it over Streamlit's
+websocket protocol, so they share one server process, its caches and its
+job workers as real users of a pod do. Each session picks its own model
+toggles, simulation count, seed and Loss Magnitude modes, sets them
+through the page's widgets and clicks Calculate, then waits until the page
+shows "Model Generated". The latency of a click therefore covers script
+reruns, queueing for a job worker, the calculation and the script polling
+for its result.
+
+Reports throughput, p50/p95/p99 click-to-result latency and, for a server
+process on this machine, its resident memory per concurrent session.
+
+Usage:
+    python loadtest.py --sessions 20 --clicks 3
+    python loadtest.py --sessions 5 10 20 40 -o loadtest_results.json
+    python loadtest.py --url http://localhost:8501 --pid 1234 --max-p95 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+# Choices of the page's "Number of Simulations" slider
+DEFAULT_SIMULATIONS = (10000, 20000, 50000, 100000)
+# Seconds a click may take before it counts as failed
+CLICK_TIMEOUT = 300
+# Seconds between samples of the server's resident memory
+MEMORY_INTERVAL = 0.1
+LATENCY_PERCENTILES = (50, 95, 99)
+
+
+def session_inputs(rng, simulations=DEFAULT_SIMULATIONS):
+    """
+    Widget values for one Calculate click, keyed by widget label.
+
+    Toggles are random (a meta model only with two models), and the seed
+    and Loss Magnitude modes vary, so clicks rarely share a cached result.
+    """
+    two_model = rng.random() < 0.5
+    inputs = {
+        "Use TEF": rng.random() < 0.5,
+        "Use Vulnerability": rng.random() < 0.5,
+        "Use Second Model": two_model,
+        "Generate Meta Model": two_model and rng.random() < 0.5,
+        "Number of Simulations": rng.choice(simulations),
+        "Random Seed": rng.randrange(2**31),
+        "LM MODE 1": round(rng.uniform(0.2, 0.8), 2),
+    }
+    if two_model:
+        inputs["LM MODE 2"] = round(rng.uniform(0.2, 0.8), 2)
+    return inputs
+
+
+class Session:
+    """One simulated browser tab connected to the app."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/").replace("http", "ws", 1) + "/_stcore/stream"
+        self.widgets = {}
+        self.alerts = []
+        self.page_script_hash = ""
+        self._socket = None
+        self._cache = {}
+
+    async def connect(self):
+        """Opens the websocket and runs the page once, as a browser does on load."""
+        from tornado.websocket import websocket_connect
+
+        self._socket = await websocket_connect(self.url, max_message_size=1 << 30)
+        await self.rerun({})
+
+    async def close(self):
+        if self._socket is not None:
+            self._socket.close()
+
+    async def rerun(self, values, click=None):
+        """
+        Reruns the script with widget values set and waits until it finishes.
+
+        Parameters:
+            - values (dict): Widget label -> value; widgets not shown on the
+              page are skipped
+            - click (str): Label of a button to click in this run
+
+        Returns:
+            - list: (format, body) of the alerts shown by the final run
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        message = BackMsg()
+        rerun = message.rerun_script
+        rerun.page_script_hash = self.page_script_hash
+        for label, value in values.items():
+            if label in self.widgets:
+                _set_widget_state(
+                    rerun.widget_states.widgets.add(), value, *self.widgets[label]
+                )
+        if click is not None:
+            state = rerun.widget_states.widgets.add()
+            state.id = self.widgets[click][1].id
+            state.trigger_value = True
+        await self._socket.write_message(message.SerializeToString(), binary=True)
+        return await self._until_finished()
+
+    async def _until_finished(self):
+        """Reads messages until a script run ends other than by st.rerun."""
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        while True:
+            data = await self._socket.read_message()
+            if data is None:
+                raise ConnectionError("The server closed the connection.")
+            message = ForwardMsg()
+            message.ParseFromString(data)
+            if message.HasField("ref_hash"):
+                message = self._cache[message.ref_hash]
+            elif message.hash:
+                self._cache[message.hash] = message
+            kind = message.WhichOneof("type")
+            if kind == "new_session":
+                self.page_script_hash = message.new_session.page_script_hash
+                self.alerts = []
+            elif kind == "delta" and message.delta.HasField("new_element"):
+                self._read_element(message.delta.new_element)
+            elif kind == "script_finished":
+                if message.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("The app failed to compile.")
+                if message.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY:
+                    return self.alerts
+
+    def _read_element(self, element):
+        kind = element.WhichOneof("type")
+        if kind in ("button", "checkbox", "number_input", "slider"):
+            widget = getattr(element, kind)
+            self.widgets[widget.label] = (kind, widget)
+        elif kind == "alert":
+            self.alerts.append((element.alert.format, element.alert.body))
+        elif kind == "exception":
+            self.alerts.append((0, element.exception.message))
+
+    async def calculate(self, values):
+        """
+        Sets values and clicks Calculate, waiting for the results.
+
+        Returns:
+            - seconds (float): From the click to the page showing the results
+            - error (str): Why the click failed, or None
+        """
+        from streamlit.proto.Alert_pb2 import Alert
+
+        # This run reveals widgets that depend on the toggles, e.g. the
+        # second model's inputs, which the click then sets too
+        await self.rerun(values)
+        started = time.perf_counter()
+        alerts = await asyncio.wait_for(
+            self.rerun(values, click="Calculate"), CLICK_TIMEOUT
+        )
+        seconds = time.perf_counter() - started
+        if (Alert.SUCCESS, "Model Generated") in alerts:
+            return seconds, None
+        errors = [body for format, body in alerts if format != Alert.SUCCESS]
+        return seconds, errors[0] if errors else "No results shown."
+
+
+def _set_widget_state(state, value, kind, widget):
+    state.id = widget.id
+    if kind == "checkbox":
+        state.bool_value = bool(value)
+    elif kind == "slider":
+        state.double_array_value.data[:] = [float(value)]
+    elif widget.data_type == widget.INT:
+        state.int_value = int(value)
+    else:
+        state.double_value = float(value)
+
+
+def resident_memory(pid):
+    """Resident set size of a process in bytes, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+async def _sample_memory(pid, samples):
+    while True:
+        rss = resident_memory(pid)
+        if rss is not None:
+            samples.append(rss)
+        await asyncio.sleep(MEMORY_INTERVAL)
+
+
+async def _run_session(url, index, clicks, seed, simulations, think_time, records):
+    rng = random.Random(f"{seed}-{index}")
+    session = Session(url)
+    try:
+        await session.connect()
+        for click in range(clicks):
+            values = session_inputs(rng, simulations)
+            try:
+                seconds, error = await session.calculate(values)
+            except Exception as e:
+                seconds, error = None, str(e) or type(e).__name__
+            records.append(
+                {
+                    "session": index,
+                    "click": click,
+                    "simulations": values["Number of Simulations"],
+                    "two_model": values["Use Second Model"],
+                    "meta_model": values["Generate Meta Model"],
+                    "seconds": seconds,
+                    "error": error,
+                }
+            )
+            if think_time:
+                await asyncio.sleep(rng.expovariate(1 / think_time))
+    finally:
+        await session.close()
+
+
+async def _load(url, sessions, clicks, seed, simulations, think_time, pid):
+    """Runs one load level; returns the click records and memory samples."""
+    records, samples = [], []
+    sampler = asyncio.ensure_future(_sample_memory(pid, samples)) if pid else None
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            _run_session(url, i, clicks, seed, simulations, think_time, records)
+            for i in range(sessions)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    if sampler is not None:
+        sampler.cancel()
+    return records, samples, elapsed
+
+
+def summarise(sessions, records, samples, elapsed, baseline_rss=None):
+    """
+    Headline numbers of one load level.
+
+    Returns:
+        - dict: sessions, clicks, errors, throughput (successful clicks per
+          second), p50/p95/p99 and mean latency in seconds, and the peak
+          server RSS and its growth over baseline_rss per session in MB
+    """
+    seconds = np.array(
+        [r["seconds"] for r in records if r["error"] is None], dtype=np.float64
+    )
+    row = {
+        "sessions": sessions,
+        "clicks": len(records),
+        "errors": sum(r["error"] is not None for r in records),
+        "throughput": len(seconds) / elapsed if elapsed else 0.0,
+    }
+    for q in LATENCY_PERCENTILES:
+        row[f"p{q}"] = float(np.percentile(seconds, q)) if len(seconds) else None
+    row["mean"] = float(seconds.mean()) if len(seconds) else None
+    row["peak_rss_mb"] = max(samples) / 1e6 if samples else None
+    row["rss_per_session_mb"] = (
+        (max(samples) - baseline_rss) / 1e6 / sessions
+        if samples and baseline_rss is not None
+        else None
+    )
+    return row
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_healthy(url, process=None, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("The Streamlit server exited during startup.")
+        try:
+            with urllib.request.urlopen(f"{url}/_stcore/health", timeout=1) as r:
+                if r.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} did not become healthy within {timeout} s.")
+
+
+def start_server(store_dir, port=None):
+    """
+    Runs main.py on a headless local Streamlit server.
+
+    New runs are saved to store_dir rather than the user's result store.
+
+    Returns:
+        - url (str): Base URL of the server
+        - process (subprocess.Popen): The server process
+    """
+    port = port or _free_port()
+    here = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "streamlit",
+            "run",
+            os.path.join(here, "main.py"),
+            "--server.headless=true",
+            f"--server.port={port}",
+            "--server.fileWatcherType=none",
+            "--browser.gatherUsageStats=false",
+        ],
+        cwd=here,
+        env={**os.environ, "PYFAIR_STORE_DIR": store_dir},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_healthy(url, process)
+    except Exception:
+        process.terminate()
+        raise
+    return url, process
+
+
+def run_load_test(
+    url,
+    session_counts,
+    clicks=3,
+    seed=0,
+    simulations=DEFAULT_SIMULATIONS,
+    think_time=0.0,
+    pid=None,
+):
+    """
+    Runs each load level in turn against a server.
+
+    A single session first clicks Calculate once, so imports, warm-up and
+    the job workers are in place before anything is measured; the server's
+    memory after it is the baseline for memory per session.
+
+    Returns:
+        - summary (pd.DataFrame): One summarise row per load level
+        - records (pd.DataFrame): Every click, with its load level
+    """
+    asyncio.run(_load(url, 1, 1, f"{seed}-warm-up", simulations, 0.0, None))
+    rows, frames = [], []
+    for level, sessions in enumerate(session_counts):
+        baseline = resident_memory(pid) if pid else None
+        records, samples, elapsed = asyncio.run(
+            _load(
+                url, sessions, clicks, f"{seed}-{level}", simulations, think_time, pid
+            )
+        )
+        rows.append(summarise(sessions, records, samples, elapsed, baseline))
+        frames.append(pd.DataFrame(records).assign(level=sessions))
+    return pd.DataFrame(rows), pd.concat(frames, ignore_index=True)
+
+
+def environment():
+    """Describes the machine and library versions a load test ran on."""
+    import streamlit
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "streamlit": streamlit.__version__,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load test the app with concurrent Calculate clicks."
+    )
+    parser.add_argument(
+        "-s",
+        "--sessions",
+        type=int,
+        nargs="+",
+        default=[10],
+        help="Concurrent sessions; several values run one load level each",
+    )
+    parser.add_argument(
+        "-c", "--clicks", type=int, default=3, help="Calculate clicks per session"
+    )
+    parser.add_argument(
+        "-n",
+        "--simulations",
+        type=int,
+        nargs="+",
+        default=list(DEFAULT_SIMULATIONS),
+        help="Simulation counts sessions choose from (slider steps of 10,000)",
+    )
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=0.0,
+        help="Mean seconds a session waits between clicks",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the sessions' choices"
+    )
+    parser.add_argument(
+        "--url",
+        help="Test a running server instead of starting one, e.g. http://localhost:8501",
+    )
+    parser.add_argument(
+        "--pid", type=int, help="Process id of the --url server, to measure its memory"
+    )
+    parser.add_argument(
+        "--max-p95",
+        type=float,
+        help="Fail if any level's p95 latency exceeds this many seconds",
+    )
+    parser.add_argument("-o", "--output", default="loadtest_results.json")
+    args = parser.parse_args(argv)
+
+    process = None
+    with tempfile.TemporaryDirectory() as store_dir:
+        if args.url:
+            url, pid = args.url, args.pid
+        else:
+            url, process = start_server(store_dir)
+            pid = process.pid
+        try:
+            summary, records = run_load_test(
+                url,
+                args.sessions,
+                args.clicks,
+                args.seed,
+                args.simulations,
+                args.think_time,
+                pid,
+            )
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "environment": environment(),
+                "summary": summary.to_dict(orient="records"),
+                "clicks": records.to_dict(orient="records"),
+            },
+            f,
+            indent=2,
+        )
+    print(summary.to_string(index=False, float_format=lambda x: f"{x:.3g}"))
+    failed = summary["errors"].sum()
+    if args.max_p95 is not None and (summary["p95"] > args.max_p95).any():
+        print(f"\np95 latency over the {args.max_p95} s budget.")
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
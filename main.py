@@ -1,124 +1,544 @@
-import pyfair
-from pyfair import FairModel
+import time
+import uuid
 import warnings
+import numpy as np
 import streamlit as st
 from decimal import Decimal
-import pandas as pd
-from io import BytesIO
+from cache import MODEL_CACHE, RESULT_CACHE, make_key
+import adaptive
+import aggregation
+import engine
+import export
+import jobs
+import metrics
+import parallel
+import portfolio
+import sensitivity
+import store
+import streaming
+import summary
+import warmup
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 
-def calculate_risk(simulations, use_tef, use_vuln, two_model, meta_model, **kwargs):
+def risk_cache_key(
+    simulations,
+    use_tef,
+    use_vuln,
+    two_model,
+    meta_model,
+    seed=42,
+    compact=None,
+    sampler=engine.MONTE_CARLO,
+    tolerance=None,
+    **kwargs,
+):
+    """Returns the content hash identifying a calculate_risk parameter set."""
+    return make_key(
+        simulations=simulations,
+        use_tef=use_tef,
+        use_vuln=use_vuln,
+        two_model=two_model,
+        meta_model=meta_model,
+        seed=seed,
+        compact=engine.compact_results() if compact is None else compact,
+        sampler=sampler,
+        tolerance=tolerance,
+        results_args=kwargs,
+    )
+
+
+def calculate_risk(
+    simulations,
+    use_tef,
+    use_vuln,
+    two_model,
+    meta_model,
+    seed=42,
+    use_cache=True,
+    progress=None,
+    compact=None,
+    sampler=engine.MONTE_CARLO,
+    tolerance=None,
+    **kwargs,
+):
     """
     Calculates risk using PyFair models based on user input.
 
+    Results are memoized in the process-wide RESULT_CACHE, keyed on the full
+    parameter set, so identical requests from any session are returned
+    without re-simulating. Models whose own inputs are unchanged are reused
+    from MODEL_CACHE, so only edited models and the meta model are
+    recomputed. The returned objects are shared and must not be mutated by
+    callers.
+
+    If given, progress(fraction, message) is called before each step; it may
+    raise (e.g. jobs.Cancelled) to abandon the calculation. compact keeps
+    the models' results as float32 tables of the simulated nodes only (see
+    engine.SimulationResult.to_frame); it defaults to PYFAIR_COMPACT_RESULTS.
+    sampler is one of engine.SAMPLERS; a Latin hypercube or Sobol sample
+    reaches the same precision as Monte Carlo with fewer simulations.
+    With a tolerance, simulations is only the budget: batches are drawn
+    until the results converge (see adaptive.simulate_until_converged).
+    Use save_run to keep the results in the result store.
+
     Returns:
         - fsr (FairSimpleReport): PyFair report object
         - model1 (FairModel): First risk model
         - model2 (FairModel): Optional second risk model
         - mm (FairMetaModel): Optional meta model
     """
-    # --- Model Creation and Input Handling ---
-    model1 = create_fair_model(
-        name="Risk Type 1",
-        use_tef=use_tef,
-        use_vuln=use_vuln,
-        simulations=simulations,
-        **kwargs,
-    )
-    model2 = (
-        create_fair_model(
-            name="Risk Type 2",
+    if compact is None:
+        compact = engine.compact_results()
+    if use_cache:
+        key = risk_cache_key(
+            simulations,
+            use_tef,
+            use_vuln,
+            two_model,
+            meta_model,
+            seed,
+            compact,
+            sampler,
+            tolerance,
+            **kwargs,
+        )
+    if use_cache:
+        with metrics.stage("cache_lookup"):
+            cached = RESULT_CACHE.get(key)
+        if cached is not None:
+            return cached
+
+    # Imported here rather than at the top to keep it off the cold start
+    import pyfair
+
+    with metrics.stage("calculate_risk"):
+        # --- Model Creation and Input Handling ---
+        names = ["Risk Type 1", "Risk Type 2"] if two_model else ["Risk Type 1"]
+        steps = len(names) + (2 if meta_model else 1)
+        report = progress or (lambda fraction, message: None)
+        models = create_fair_models(
+            names=names,
             use_tef=use_tef,
             use_vuln=use_vuln,
             simulations=simulations,
+            seed=seed,
+            progress=lambda fraction, message: report(
+                fraction * len(names) / steps, message
+            ),
+            use_cache=use_cache,
+            compact=compact,
+            sampler=sampler,
+            tolerance=tolerance,
+            meta_model=meta_model,
             **kwargs,
         )
-        if two_model
-        else None
+        model1 = models[0]
+        model2 = models[1] if two_model else None
+
+        # --- Metamodel ---
+        mm = None
+        if meta_model:
+            report(len(names) / steps, "Calculating meta model")
+            with metrics.stage("meta_model"):
+                mm = pyfair.FairMetaModel(name="Meta Model", models=models)
+                mm.calculate_all()
+            models.append(mm)
+
+        # --- Reporting ---
+        report((steps - 1) / steps, "Preparing report")
+        with metrics.stage("report_init"):
+            fsr = pyfair.FairSimpleReport(models, currency_prefix="GBP ")
+        result = (fsr, model1, model2, mm)
+        if use_cache:
+            RESULT_CACHE.put(key, result, nbytes=_results_nbytes(models))
+    return result
+
+
+def save_run(result_store, key, results, calculation):
+    """
+    Saves calculate_risk results with their inputs, unless already stored.
+
+    Parameters:
+        - result_store (store.ResultStore): Store to save into
+        - key (str): risk_cache_key of the calculation
+        - results (tuple): What calculate_risk returned for it
+        - calculation (dict): The arguments calculate_risk was called with
+
+    Returns:
+        - str: Id of the stored run
+    """
+    run_id = result_store.find(key)
+    if run_id is not None:
+        return run_id
+    parameters = dict(calculation)
+    if parameters.get("compact") is None:
+        parameters["compact"] = engine.compact_results()
+    names = (
+        ["Risk Type 1", "Risk Type 2"] if calculation["two_model"] else ["Risk Type 1"]
     )
+    models = [model for model in results[1:] if model is not None]
+    with metrics.stage("store_save"):
+        return result_store.save(
+            {model.get_name(): model.export_results() for model in models},
+            parameters,
+            key=key,
+            inputs={name: collect_model_inputs(name, **calculation) for name in names},
+        )
 
-    models = [model1]
-    if two_model:
-        models.append(model2)
 
-    # --- Metamodel ---
-    mm = pyfair.FairMetaModel(name="Meta Model", models=models) if meta_model else None
-    if mm:
-        mm.calculate_all()
-        models.append(mm)
+def stream_risk(
+    simulations,
+    use_tef,
+    use_vuln,
+    two_model,
+    meta_model,
+    chunk_size=streaming.DEFAULT_CHUNK_SIZE,
+    seed=42,
+    **kwargs,
+):
+    """
+    Chunked counterpart of calculate_risk for very large simulation counts.
 
-    # --- Reporting ---
-    fsr = pyfair.FairSimpleReport(models, currency_prefix="GBP ")
-    return fsr, model1, model2, mm
+    Only running summaries are kept, so no FairModel, report or per-draw
+    export is produced.
 
+    Yields:
+        - n_done (int): Simulations completed so far
+        - summaries (dict): Model name -> node name -> RunningSummary
+    """
+    names = ["Risk Type 1", "Risk Type 2"] if two_model else ["Risk Type 1"]
+    model_inputs = {
+        name: collect_model_inputs(name, use_tef, use_vuln, **kwargs) for name in names
+    }
+    yield from streaming.stream_models(
+        model_inputs,
+        simulations,
+        chunk_size=chunk_size,
+        random_seed=seed,
+        meta_model=meta_model and two_model,
+    )
 
-def create_fair_model(name, use_tef, use_vuln, simulations, **kwargs):
-    """Creates a FairModel with input data based on provided parameters."""
-    model = FairModel(name=name, n_simulations=simulations)
 
-    # Input the loss magnitude parameters
-    model.input_data(
-        "Loss Magnitude",
-        low=kwargs.get(f"lm_low_{name[-1]}"),
-        mode=kwargs.get(f"lm_mode_{name[-1]}"),
-        high=kwargs.get(f"lm_high_{name[-1]}"),
+def calculate_sensitivity(
+    simulations,
+    use_tef,
+    use_vuln,
+    two_model,
+    swing=sensitivity.DEFAULT_SWING,
+    seed=42,
+    **kwargs,
+):
+    """
+    Runs a tornado analysis of ALE for each model.
+
+    Returns:
+        - dict: Model name -> (base ALE, sensitivity table)
+    """
+    names = ["Risk Type 1", "Risk Type 2"] if two_model else ["Risk Type 1"]
+    return {
+        name: sensitivity.tornado(
+            collect_model_inputs(name, use_tef, use_vuln, **kwargs),
+            simulations,
+            random_seed=engine.model_seed(seed, i),
+            swing=swing,
+        )
+        for i, name in enumerate(names)
+    }
+
+
+def portfolio_cache_key(scenarios, use_tef, use_vuln, simulations, seed, compact):
+    """Returns the content hash identifying a calculate_portfolio parameter set."""
+    return make_key(
+        scenarios=scenarios,
+        use_tef=use_tef,
+        use_vuln=use_vuln,
+        simulations=simulations,
+        seed=seed,
+        compact=compact,
     )
 
-    # Input the frequency-related parameters based on whether TEF is used
-    if use_tef:
-        model.input_data(
-            "Threat Event Frequency",
-            low=kwargs.get(f"tef_low_{name[-1]}"),
-            mode=kwargs.get(f"tef_mode_{name[-1]}"),
-            high=kwargs.get(f"tef_high_{name[-1]}"),
+
+def calculate_portfolio(
+    scenarios,
+    use_tef,
+    use_vuln,
+    simulations,
+    seed=42,
+    use_cache=True,
+    progress=None,
+    compact=None,
+):
+    """
+    Simulates a portfolio of any number of scenarios in one batch.
+
+    Parameters:
+        - scenarios (list): One dict per scenario with a "Scenario" name and
+          the portfolio.scenario_columns fields (Loss Magnitude in £ million)
+        - use_tef, use_vuln (bool): Input layout shared by every scenario
+        - simulations (int): Draws per scenario
+        - seed (int): Run seed; each scenario draws from its own stream
+        - use_cache, progress, compact: As for calculate_risk
+
+    Returns:
+        - portfolio.PortfolioResult: Risk of every scenario and their total
+    """
+    if compact is None:
+        compact = engine.compact_results()
+    if use_cache:
+        key = portfolio_cache_key(
+            scenarios, use_tef, use_vuln, simulations, seed, compact
         )
-    else:
-        model.input_data(
-            "Contact Frequency",
-            low=kwargs.get(f"contact_low_{name[-1]}"),
-            mode=kwargs.get(f"contact_mode_{name[-1]}"),
-            high=kwargs.get(f"contact_high_{name[-1]}"),
+        cached = RESULT_CACHE.get(key)
+        if cached is not None:
+            return cached
+
+    names = []
+    for i, scenario in enumerate(scenarios):
+        # Blank name cells arrive from st.data_editor as NaN or None
+        name = scenario.get("Scenario")
+        names.append(
+            name.strip() if isinstance(name, str) and name.strip() else f"Risk {i + 1}"
         )
-        model.input_data(
-            "Probability of Action",
-            low=kwargs.get(f"action_low_{name[-1]}"),
-            mode=kwargs.get(f"action_mode_{name[-1]}"),
-            high=kwargs.get(f"action_high_{name[-1]}"),
+    portfolio.check_names(names)
+    with metrics.stage("calculate_portfolio"):
+        result = portfolio.simulate_portfolio(
+            names,
+            [
+                portfolio.scenario_inputs(scenario, use_tef, use_vuln)
+                for scenario in scenarios
+            ],
+            simulations,
+            random_seed=seed,
+            compact=compact,
+            progress=progress,
         )
+    with metrics.stage("portfolio_summary"):
+        result.summary()
+    if use_cache:
+        RESULT_CACHE.put(key, result, nbytes=result.nbytes)
+    return result
 
-    # Input the vulnerability/threat-related parameters based on whether vulnerability is used
-    if use_vuln:
-        model.input_data(
-            "Vulnerability",
-            low=kwargs.get(f"vuln_low_{name[-1]}"),
-            mode=kwargs.get(f"vuln_mode_{name[-1]}"),
-            high=kwargs.get(f"vuln_high_{name[-1]}"),
-        )
+
+def _results_nbytes(models):
+    """Approximates the memory held by the simulation tables of the given models."""
+    return int(
+        sum(model.export_results().memory_usage(index=True).sum() for model in models)
+    )
+
+
+def collect_model_inputs(name, use_tef, use_vuln, **kwargs):
+    """
+    Collects the Beta-PERT inputs for a model from the flat results_args keys.
+
+    Returns:
+        - inputs (dict): Node name -> {"low", "mode", "high"}, in draw order
+    """
+    suffix = name[-1]
+    return {
+        target: {
+            "low": kwargs.get(f"{prefix}_low_{suffix}"),
+            "mode": kwargs.get(f"{prefix}_mode_{suffix}"),
+            "high": kwargs.get(f"{prefix}_high_{suffix}"),
+        }
+        for target, prefix in portfolio.node_prefixes(use_tef, use_vuln).items()
+    }
+
+
+def model_cache_key(
+    name, inputs, simulations, seed, compact=False, sampler=engine.MONTE_CARLO
+):
+    """Returns the content hash identifying one model's simulation."""
+    return make_key(
+        name=name,
+        inputs=inputs,
+        simulations=simulations,
+        seed=seed,
+        compact=compact,
+        sampler=sampler,
+    )
+
+
+def create_fair_models(
+    names,
+    use_tef,
+    use_vuln,
+    simulations,
+    seed=42,
+    progress=None,
+    use_cache=True,
+    compact=None,
+    sampler=engine.MONTE_CARLO,
+    tolerance=None,
+    meta_model=False,
+    **kwargs,
+):
+    """
+    Creates a calculated FairModel for each name.
+
+    Each model draws from its own stream derived from seed and its position
+    in names, so results are reproducible and independent of how many
+    models follow it. Large multi-model runs are simulated concurrently on
+    the shared process pool; small ones run in-process, where the pool
+    overhead would dominate. Both paths give identical results.
+
+    Models are also memoized individually in MODEL_CACHE, keyed on their own
+    inputs, simulation count and seed, so editing one model's inputs only
+    re-simulates that model.
+
+    With a tolerance, the models are simulated together until they (and
+    their total, with meta_model) converge or simulations is reached. The
+    models then depend on each other's draw count, so they bypass
+    MODEL_CACHE.
+
+    If given, progress(fraction, message) is called before each model is
+    simulated (or once, before a parallel run, or after each adaptive batch).
+    """
+    report = progress or (lambda fraction, message: None)
+    if compact is None:
+        compact = engine.compact_results()
+    seeds = [engine.model_seed(seed, i) for i in range(len(names))]
+    with metrics.stage("collect_inputs"):
+        model_inputs = [
+            collect_model_inputs(name, use_tef, use_vuln, **kwargs) for name in names
+        ]
+    if tolerance is not None:
+        with metrics.stage("simulate_adaptive", models=len(names)):
+            results, _ = adaptive.simulate_until_converged(
+                model_inputs,
+                simulations,
+                tolerance,
+                random_seeds=seeds,
+                sampler=sampler,
+                meta_model=meta_model,
+                progress=report,
+            )
+        models = []
+        for name, inputs, result, model_seed in zip(
+            names, model_inputs, results, seeds
+        ):
+            with metrics.stage("to_fair_model", model=name):
+                models.append(
+                    engine.to_fair_model(
+                        name, inputs, result, random_seed=model_seed, compact=compact
+                    )
+                )
+        return models
+
+    models = [None] * len(names)
+    if use_cache:
+        keys = [
+            model_cache_key(name, inputs, simulations, model_seed, compact, sampler)
+            for name, inputs, model_seed in zip(names, model_inputs, seeds)
+        ]
+        models = [MODEL_CACHE.get(key) for key in keys]
+    missing = [i for i, model in enumerate(models) if model is None]
+
+    if not parallel.should_parallelize(len(missing), simulations):
+        for n, i in enumerate(missing):
+            report(n / len(missing), f"Simulating {names[i]}")
+            models[i] = create_fair_model(
+                names[i],
+                use_tef,
+                use_vuln,
+                simulations,
+                seed=seeds[i],
+                compact=compact,
+                sampler=sampler,
+                **kwargs,
+            )
     else:
-        model.input_data(
-            "Threat Capability",
-            low=kwargs.get(f"threat_low_{name[-1]}"),
-            mode=kwargs.get(f"threat_mode_{name[-1]}"),
-            high=kwargs.get(f"threat_high_{name[-1]}"),
-        )
-        model.input_data(
-            "Control Strength",
-            low=kwargs.get(f"control_low_{name[-1]}"),
-            mode=kwargs.get(f"control_mode_{name[-1]}"),
-            high=kwargs.get(f"control_high_{name[-1]}"),
-        )
+        report(0.0, f"Simulating {len(missing)} models")
+        with metrics.stage("simulate_parallel", models=len(missing)):
+            results = parallel.simulate_models(
+                [model_inputs[i] for i in missing],
+                simulations,
+                random_seeds=[seeds[i] for i in missing],
+                sampler=sampler,
+            )
+        for i, result in zip(missing, results):
+            with metrics.stage("to_fair_model", model=names[i]):
+                models[i] = engine.to_fair_model(
+                    names[i],
+                    model_inputs[i],
+                    result,
+                    random_seed=seeds[i],
+                    compact=compact,
+                )
+
+    if use_cache:
+        for i in missing:
+            MODEL_CACHE.put(keys[i], models[i], nbytes=_results_nbytes([models[i]]))
+    return models
+
+
+def create_fair_model(
+    name,
+    use_tef,
+    use_vuln,
+    simulations,
+    seed=42,
+    compact=None,
+    sampler=engine.MONTE_CARLO,
+    **kwargs,
+):
+    """
+    Creates a calculated FairModel with input data based on provided parameters.
+
+    The simulation runs on the vectorized engine, which with the default
+    Monte Carlo sampler reproduces FairModel.calculate_all() draw for draw
+    for the same seed.
+    """
+    with metrics.stage("create_fair_model", model=name):
+        with metrics.stage("collect_inputs"):
+            inputs = collect_model_inputs(name, use_tef, use_vuln, **kwargs)
+        with metrics.stage("simulate", model=name):
+            result = engine.simulate_model(
+                inputs, simulations, random_seed=seed, sampler=sampler
+            )
+        with metrics.stage("to_fair_model", model=name):
+            return engine.to_fair_model(
+                name,
+                inputs,
+                result,
+                random_seed=seed,
+                compact=engine.compact_results() if compact is None else compact,
+            )
+
 
-    model.calculate_all()
-    return model
+def keep_saved_run(key, results, calculation):
+    """Saves a run to store.STORE, letting this session delete it from History."""
+    run_id = save_run(store.STORE, key, results, calculation)
+    st.session_state.setdefault("saved_runs", set()).add(run_id)
+
+
+@st.cache_resource(show_spinner=False)
+def warm_start():
+    """Starts warmup on its background thread, once per server process."""
+    return warmup.start()
 
 
 if __name__ == "__main__":
+    script_started = time.perf_counter()
     st.set_page_config(
         layout="wide"
     )
     st.title("PyFair Calculator")
+    metrics.serve_from_env()
+    metrics.trace_memory_from_env()
+    warm_start()
+    with st.sidebar:
+        debug = st.checkbox(
+            "Show debug panel",
+            value=False,
+            help="Per-stage timings for the last request and totals for this server process.\n\nSet PYFAIR_METRICS_PORT to also serve them in Prometheus format at /metrics, and PYFAIR_TRACE_MEMORY to record each stage's peak allocation.",
+        )
+        save_runs = st.checkbox(
+            "Save runs",
+            value=True,
+            help=f"Keep each calculation in the result store ({store.STORE.root}) to reload or compare on the History page. Runs saved in this session can be deleted there.",
+        )
     st.subheader(
         "Which parameters will you be providing?",
         help="If providing Contactand Action, untick Use TEF.\n\nIf providing Threat Capability and Control (Resistance) Strength, untick Use Vulnerability",
@@ -133,8 +553,69 @@ if __name__ == "__main__":
     with provided4:
         meta_model = st.checkbox("Generate Meta Model", value=False)
 
-    simulations = st.slider(
-        "Number of Simulations", min_value=10000, max_value=100000, step=10000
+    streaming_mode = st.checkbox(
+        "Streaming Mode",
+        value=False,
+        help="Simulate in fixed-size chunks, keeping only running summaries, so very large simulation counts run in bounded memory.\n\nNo report or XLSX is produced in this mode.",
+    )
+    adaptive_mode = not streaming_mode and st.checkbox(
+        "Adaptive Simulations",
+        value=False,
+        help="Simulate in batches until the mean ALE and its P90/P95 are known "
+        "to within the tolerance (95% confidence), up to the maximum.",
+    )
+    tolerance = None
+    if streaming_mode:
+        simulations = st.number_input(
+            "Number of Simulations",
+            min_value=100000,
+            max_value=100000000,
+            step=1000000,
+            value=10000000,
+        )
+    elif adaptive_mode:
+        budget1, budget2 = st.columns(spec=2)
+        with budget1:
+            simulations = st.number_input(
+                "Maximum Simulations",
+                min_value=adaptive.MIN_BATCHES * adaptive.DEFAULT_BATCH_SIZE,
+                max_value=2000000,
+                step=adaptive.DEFAULT_BATCH_SIZE,
+                value=1000000,
+            )
+        with budget2:
+            tolerance = (
+                st.number_input(
+                    "Tolerance (%)",
+                    min_value=0.1,
+                    max_value=10.0,
+                    step=0.1,
+                    value=adaptive.DEFAULT_TOLERANCE * 100,
+                )
+                / 100
+            )
+    else:
+        simulations = st.slider(
+            "Number of Simulations", min_value=10000, max_value=100000, step=10000
+        )
+    sampler = engine.MONTE_CARLO
+    if not streaming_mode:
+        sampler = st.selectbox(
+            "Sampler",
+            engine.SAMPLERS,
+            help="Monte Carlo reproduces pyfair's own draws. Monte Carlo (inverse CDF) "
+            "draws the same distributions from lookup tables, which is faster. "
+            "Latin hypercube and Sobol spread the draws evenly over the inputs, "
+            "so results settle with far fewer simulations. The standard error "
+            "of the mean ALE is shown with the results.",
+        )
+    seed = st.number_input(
+        "Random Seed",
+        min_value=0,
+        max_value=2**32 - 1,
+        value=42,
+        step=1,
+        help="The same inputs and seed always reproduce the same results. Each model draws from its own stream derived from this seed.",
     )
     results_args = {}
     col1, col2, col3, col4 = st.columns(spec=4)
@@ -656,46 +1137,286 @@ if __name__ == "__main__":
                 results_args["control_high_2"] = control_high_2
 
     submitted = st.button("Calculate")
+    calculation = dict(
+        simulations=simulations,
+        use_tef=use_tef,
+        use_vuln=use_vuln,
+        two_model=two_model,
+        meta_model=meta_model,
+        seed=seed,
+        sampler=sampler,
+        tolerance=tolerance,
+        **results_args,
+    )
+    result_key = risk_cache_key(**calculation)
 
-    if submitted:
-        fsr, model1, model2, mm = calculate_risk(
-            simulations=simulations,
-            use_tef=use_tef,
-            use_vuln=use_vuln,
-            two_model=two_model,
-            meta_model=meta_model,
-            **results_args,
-        )
-        if fsr:
-            st.success("Model Generated")
-            binary_file = fsr.to_html("output.html")
-            with open("output.html", "rb") as file:
-                btn = st.download_button(
-                    label="Download Report",
-                    data=file,
-                    file_name="output.html",
-                    mime="text/html",
-                )
-            df_model1 = model1.export_results()
-            if two_model:
-                df_model2 = model2.export_results()
-            if meta_model:
-                df_mm = mm.export_results()
-
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-                df_model1.to_excel(writer, sheet_name="Model 1", index=False)
-                if two_model:
-                    df_model2.to_excel(writer, sheet_name="Model 2", index=False)
-                if meta_model:
-                    df_mm.to_excel(writer, sheet_name="Meta Model", index=False)
-            output.seek(0)
-            xlsx_btn = st.download_button(
-                label="Download Simulation as XLSX",
-                data=output,
-                file_name="output.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    with metrics.trace() as records:
+        if submitted and streaming_mode:
+            from pyfair.utility.fair_exception import FairException
+
+            progress = st.progress(0.0, text="Simulating...")
+            table = st.empty()
+            chart = st.empty()
+            try:
+                for n_done, summaries in stream_risk(
+                    simulations=simulations,
+                    use_tef=use_tef,
+                    use_vuln=use_vuln,
+                    two_model=two_model,
+                    meta_model=meta_model,
+                    seed=seed,
+                    **results_args,
+                ):
+                    progress.progress(
+                        n_done / simulations,
+                        text=f"Simulated {n_done:,} of {simulations:,}",
+                    )
+                    table.dataframe(streaming.risk_summary_frame(summaries))
+                    headline = summaries.get("Meta Model", summaries["Risk Type 1"])[
+                        "Risk"
+                    ]
+                    chart.bar_chart(streaming.risk_histogram(headline))
+                st.success("Model Generated")
+            except FairException as e:
+                st.error(f"Error generating Model: {e}")
+
+        elif submitted:
+            session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+            if "job" in st.session_state:
+                jobs.JOBS.release(st.session_state.pop("job"), session_id)
+            if result_key in RESULT_CACHE:
+                results = calculate_risk(**calculation)
+                st.session_state["results"] = (result_key, results)
+                if save_runs:
+                    keep_saved_run(result_key, results, calculation)
+            else:
+                job = jobs.JOBS.submit(
+                    result_key,
+                    lambda report: calculate_risk(progress=report, **calculation),
+                    owner=session_id,
+                )
+                st.session_state["job"] = job.id
+
+        # Calculations run as background jobs; follow or collect this session's
+        job_id = st.session_state.get("job")
+        job = jobs.JOBS.get(job_id) if job_id else None
+        if job_id and (job is None or job.key != result_key or streaming_mode):
+            # The inputs changed, so nobody in this session needs the run
+            jobs.JOBS.release(
+                st.session_state.pop("job"), st.session_state["session_id"]
             )
+        elif job is not None:
+            if job.status == jobs.DONE:
+                st.session_state["results"] = (result_key, job.result)
+                if save_runs:
+                    keep_saved_run(result_key, job.result, calculation)
+                records[:0] = job.trace
+                jobs.JOBS.release(
+                    st.session_state.pop("job"), st.session_state["session_id"]
+                )
+            elif job.status == jobs.FAILED:
+                st.error(f"Error generating Model: {job.error}")
+                jobs.JOBS.release(
+                    st.session_state.pop("job"), st.session_state["session_id"]
+                )
+            elif job.cancelled:
+                st.warning("Calculation cancelled")
+                jobs.JOBS.release(
+                    st.session_state.pop("job"), st.session_state["session_id"]
+                )
+            else:
+                st.progress(job.progress, text=job.message)
+                if st.button("Cancel"):
+                    jobs.JOBS.release(
+                        st.session_state.pop("job"), st.session_state["session_id"]
+                    )
+                    st.warning("Calculation cancelled")
+                else:
+                    time.sleep(jobs.POLL_INTERVAL)
+                    st.rerun()
 
-        else:
-            st.error("Error generating Model")
+        # Results persist across reruns (e.g. download clicks) until inputs change
+        stored = st.session_state.get("results")
+        if not streaming_mode and stored and stored[0] == result_key:
+            fsr, model1, model2, mm = stored[1]
+            if fsr:
+                st.success("Model Generated")
+                with metrics.stage("export_results"):
+                    sheets = {"Model 1": model1.export_results()}
+                    if two_model:
+                        sheets["Model 2"] = model2.export_results()
+                    if meta_model:
+                        sheets["Meta Model"] = mm.export_results()
+
+                # Headline numbers come straight from the simulated losses
+                with metrics.stage("summary"):
+                    risks = {name: df["Risk"].to_numpy() for name, df in sheets.items()}
+                    n_done = len(risks["Model 1"])
+                    if tolerance is not None:
+                        # Adaptive batches are independent replicates
+                        replicates = [adaptive.DEFAULT_BATCH_SIZE] * (
+                            n_done // adaptive.DEFAULT_BATCH_SIZE
+                        )
+                        convergence = adaptive.convergence_table(
+                            risks, adaptive.DEFAULT_BATCH_SIZE
+                        )
+                    elif sampler in engine.STRATIFIED:
+                        replicates = engine.replicate_sizes(n_done)
+                    else:
+                        replicates = None
+                    ale_table = summary.summary_table(risks, replicates)
+                    exceedance = summary.exceedance_curve(risks)
+                headline = ale_table.loc["Meta Model" if meta_model else "Model 1"]
+                for column, label in zip(
+                    st.columns(4), ("Mean", "P90", "VaR 99%", "ES 99%")
+                ):
+                    column.metric(
+                        label if label != "Mean" else "Mean ALE",
+                        f"GBP {headline[label]:,.0f}",
+                    )
+                st.caption(
+                    f"Mean ALE standard error: GBP {headline['Std Error']:,.0f} "
+                    f"({sampler}, {n_done:,} simulations)"
+                )
+                if tolerance is not None:
+                    error = float(convergence.to_numpy().max())
+                    if error <= tolerance:
+                        st.info(
+                            f"Converged after {n_done:,} of at most "
+                            f"{simulations:,} simulations (largest relative "
+                            f"error {error:.2%})"
+                        )
+                    else:
+                        st.warning(
+                            f"Not converged within {simulations:,} simulations: "
+                            f"largest relative error {error:.2%}, tolerance "
+                            f"{tolerance:.2%}"
+                        )
+                    st.dataframe(convergence.style.format("{:.2%}"))
+                st.dataframe(ale_table.style.format("{:,.0f}"))
+                st.line_chart(exceedance)
+
+                # FairMetaModel assumes the models are independent
+                if meta_model and two_model:
+                    with st.expander("Correlated Meta Model"):
+                        correlation = st.slider(
+                            "Rank correlation between models",
+                            min_value=0.0,
+                            max_value=0.95,
+                            value=0.5,
+                            step=0.05,
+                        )
+                        method = st.selectbox("Method", list(aggregation.METHODS))
+                        with metrics.stage("aggregate", method=method):
+                            total, contributions = aggregation.aggregate(
+                                ["Model 1", "Model 2"],
+                                np.stack([risks["Model 1"], risks["Model 2"]]),
+                                correlation,
+                                method,
+                                seed,
+                            )
+                        correlated = summary.ale_summary(total)
+                        for column, label in zip(
+                            st.columns(3), ("VaR 95%", "VaR 99%", "ES 99%")
+                        ):
+                            column.metric(
+                                label,
+                                f"GBP {correlated[label]:,.0f}",
+                                delta=f"{correlated[label] - headline[label]:,.0f}"
+                                " vs independent",
+                                delta_color="inverse",
+                            )
+                        st.dataframe(contributions.style.format("{:,.0f}"))
+
+                # The full report renders matplotlib charts for every model, so
+                # it is only built on request, on the background render thread
+                report_job = st.session_state.get("report_job")
+                if export.is_cached(result_key, "html"):
+                    report = export.cached_export(
+                        result_key, "html", lambda: export.report_html(fsr)
+                    )
+                    btn = st.download_button(
+                        label="Download Report",
+                        data=report,
+                        file_name="output.html",
+                        mime="text/html",
+                    )
+                elif export.pending_export(result_key, "html") is not None:
+                    st.info("Rendering the full report in the background...")
+                    st.button("Refresh")
+                else:
+                    if report_job and report_job[0] == result_key:
+                        error = report_job[1].exception()
+                        if error is not None:
+                            st.error(f"Error rendering report: {error}")
+                    if st.button("Prepare Full Report"):
+                        st.session_state["report_job"] = (
+                            result_key,
+                            export.submit_export(
+                                result_key, "html", lambda: export.report_html(fsr)
+                            ),
+                        )
+                        st.info("Rendering the full report in the background...")
+                        st.button("Refresh")
+
+                export_format = st.selectbox(
+                    "Simulation export format",
+                    options=list(export.EXPORT_FORMATS),
+                    help="XLSX is slowest for large runs; a model with more simulations than fit on one worksheet (1,048,575) continues on further sheets. Parquet, CSV and Arrow downloads are zips with one file per model.",
+                )
+                build, file_name, mime = export.EXPORT_FORMATS[export_format]
+                if export.is_cached(result_key, export_format) or st.button(
+                    "Prepare Simulation Export"
+                ):
+                    with st.spinner(f"Writing {export_format}..."):
+                        output = export.cached_export(
+                            result_key, export_format, lambda: build(sheets)
+                        )
+                    xlsx_btn = st.download_button(
+                        label=f"Download Simulation as {export_format}",
+                        data=output,
+                        file_name=file_name,
+                        mime=mime,
+                    )
+
+                with st.expander("Sensitivity Analysis"):
+                    swing = st.slider(
+                        "Swing (% of each input's range)",
+                        min_value=1,
+                        max_value=50,
+                        value=10,
+                        help="Each low/mode/high is moved down and up by this share of its low-high range. All cases reuse the same random draws.",
+                    )
+                    if st.button("Run Sensitivity Analysis"):
+                        tornadoes = calculate_sensitivity(
+                            simulations=n_done,
+                            use_tef=use_tef,
+                            use_vuln=use_vuln,
+                            two_model=two_model,
+                            swing=swing / 100,
+                            seed=seed,
+                            **results_args,
+                        )
+                        for name, (base, table) in tornadoes.items():
+                            st.write(f"{name}: base ALE GBP {base:,.0f}")
+                            st.pyplot(sensitivity.tornado_figure(base, table))
+                            st.dataframe(table, hide_index=True)
+
+            else:
+                st.error("Error generating Model")
+
+    if records:
+        st.session_state["trace"] = records
+    # Script time of this rerun, before drawing the debug panel
+    metrics.record("script_run", time.perf_counter() - script_started)
+    if debug:
+        with st.sidebar:
+            st.write("Last request")
+            st.dataframe(st.session_state.get("trace", []), hide_index=True)
+            st.write("This process")
+            st.dataframe(metrics.STAGE_METRICS.rows(), hide_index=True)
+            for cache_name, cache in metrics.CACHES.items():
+                st.caption(
+                    f"{cache_name.title()} cache: {len(cache)} entries, "
+                    f"{cache.nbytes / 2**20:,.1f} MiB, {cache.hits} hits, {cache.misses} misses"
+                )
@@ -0,0 +1,320 @@
+"""
+Per-stage timing and memory instrumentation for the submit path.
+
+Wrap a step in ``with metrics.stage("name", label=value):`` to time it. Every
+completed stage is
+
+    - folded into the process-wide STAGE_METRICS registry (count, duration
+      histogram and worst peak memory per stage and label set), which
+      render_prometheus() exposes in the Prometheus text format,
+    - logged as one JSON line on the "metrics" logger at INFO level, and
+    - appended to the records of any enclosing ``metrics.trace()`` on the
+      same thread, which is how the app's debug panel shows the stages of
+      the last request.
+
+Peak memory is only measured while tracemalloc is tracing, since tracing
+slows allocation-heavy code noticeably. tracemalloc is process-wide, so it
+is an operator setting rather than a per-session one: set
+PYFAIR_TRACE_MEMORY to trace from startup (see trace_memory_from_env). With
+several sessions running at once the peaks are approximate.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from cache import EXPORT_CACHE, MODEL_CACHE, RESULT_CACHE
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CACHES = {"result": RESULT_CACHE, "model": MODEL_CACHE, "export": EXPORT_CACHE}
+
+
+class StageMetrics:
+    """Thread-safe aggregate of stage timings keyed by stage and labels."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, seconds, peak_bytes=None):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    "count": 0,
+                    "sum": 0.0,
+                    "max": 0.0,
+                    "buckets": [0] * len(self.buckets),
+                    "peak_bytes": None,
+                }
+            stats["count"] += 1
+            stats["sum"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stats["buckets"][i] += 1
+            if peak_bytes is not None:
+                stats["peak_bytes"] = max(stats["peak_bytes"] or 0, peak_bytes)
+
+    def snapshot(self):
+        """Copy of the current stats as {(stage, labels): stats}."""
+        with self._lock:
+            return {
+                key: {**stats, "buckets": list(stats["buckets"])}
+                for key, stats in self._stats.items()
+            }
+
+    def rows(self):
+        """One dict per stage and label set, for tabular display."""
+        rows = []
+        for (name, labels), stats in sorted(self.snapshot().items()):
+            rows.append(
+                {
+                    "stage": name,
+                    **dict(labels),
+                    "count": stats["count"],
+                    "mean_seconds": stats["sum"] / stats["count"],
+                    "max_seconds": stats["max"],
+                    "peak_bytes": stats["peak_bytes"],
+                }
+            )
+        return rows
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+STAGE_METRICS = StageMetrics()
+_local = threading.local()
+_trace_memory = None
+_trace_lock = threading.Lock()
+
+
+def _frames():
+    return _local.__dict__.setdefault("frames", [])
+
+
+def set_memory_tracing(enabled):
+    """Starts or stops tracemalloc so stages also record peak memory."""
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def trace_memory_from_env():
+    """
+    Starts tracemalloc if PYFAIR_TRACE_MEMORY is set.
+
+    The variable is read on the first call only, so reruns cannot toggle
+    tracing for the whole process.
+
+    Returns:
+        - bool: Whether memory tracing was requested
+    """
+    global _trace_memory
+    with _trace_lock:
+        if _trace_memory is None:
+            _trace_memory = os.environ.get("PYFAIR_TRACE_MEMORY", "").lower() in (
+                "1",
+                "true",
+                "yes",
+            )
+            if _trace_memory:
+                set_memory_tracing(True)
+    return _trace_memory
+
+
+@contextmanager
+def stage(name, **labels):
+    """
+    Times the enclosed block as stage name, tagged with labels.
+
+    Stages may nest. A parent's peak memory covers its nested stages.
+    """
+    frames = _frames()
+    tracing = tracemalloc.is_tracing()
+    frame = {"start": 0, "peak": 0}
+    if tracing:
+        # reset_peak() below would hide the peaks enclosing stages saw so far
+        current, peak = tracemalloc.get_traced_memory()
+        for parent in frames:
+            parent["peak"] = max(parent["peak"], peak)
+        tracemalloc.reset_peak()
+        frame["start"] = current
+    frames.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        frames.pop()
+        peak_bytes = None
+        if tracing and tracemalloc.is_tracing():
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            peak_bytes = max(peak - frame["start"], 0)
+        record(name, seconds, peak_bytes, **labels)
+
+
+def record(name, seconds, peak_bytes=None, **labels):
+    """Registers a completed stage measured elsewhere."""
+    STAGE_METRICS.observe(name, labels, seconds, peak_bytes)
+    entry = {"stage": name, **labels, "seconds": seconds, "peak_bytes": peak_bytes}
+    for records in getattr(_local, "traces", ()):
+        records.append(entry)
+    logger.info(json.dumps(entry))
+
+
+@contextmanager
+def trace():
+    """Collects the stages completed on this thread while the block runs."""
+    records = []
+    traces = _local.__dict__.setdefault("traces", [])
+    traces.append(records)
+    try:
+        yield records
+    finally:
+        traces.remove(records)
+
+
+def max_rss_bytes():
+    """Peak resident set size of this process, or None if unavailable."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if os.uname().sysname == "Darwin" else rss * 1024
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def render_prometheus():
+    """Returns all metrics in the Prometheus text exposition format."""
+    snapshot = STAGE_METRICS.snapshot()
+    lines = [
+        "# HELP pyfair_stage_duration_seconds Wall time of each submit-path stage.",
+        "# TYPE pyfair_stage_duration_seconds histogram",
+    ]
+    for (name, labels), stats in sorted(snapshot.items()):
+        base = (("stage", name),) + labels
+        for bound, count in zip(STAGE_METRICS.buckets, stats["buckets"]):
+            lines.append(
+                f"pyfair_stage_duration_seconds_bucket"
+                f"{_format_labels(base + (('le', f'{bound:g}'),))} {count}"
+            )
+        lines.append(
+            f"pyfair_stage_duration_seconds_bucket"
+            f"{_format_labels(base + (('le', '+Inf'),))} {stats['count']}"
+        )
+        lines.append(
+            f"pyfair_stage_duration_seconds_sum{_format_labels(base)} {stats['sum']}"
+        )
+        lines.append(
+            f"pyfair_stage_duration_seconds_count{_format_labels(base)} {stats['count']}"
+        )
+
+    lines += [
+        "# HELP pyfair_stage_peak_memory_bytes Largest traced peak allocation of each stage.",
+        "# TYPE pyfair_stage_peak_memory_bytes gauge",
+    ]
+    for (name, labels), stats in sorted(snapshot.items()):
+        if stats["peak_bytes"] is not None:
+            lines.append(
+                f"pyfair_stage_peak_memory_bytes"
+                f"{_format_labels((('stage', name),) + labels)} {stats['peak_bytes']}"
+            )
+
+    for metric, kind, help_text, attribute in (
+        ("pyfair_cache_hits_total", "counter", "Cache lookups served.", "hits"),
+        ("pyfair_cache_misses_total", "counter", "Cache lookups missed.", "misses"),
+        ("pyfair_cache_entries", "gauge", "Entries held.", "__len__"),
+        ("pyfair_cache_bytes", "gauge", "Approximate bytes held.", "nbytes"),
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        for cache_name, cache in CACHES.items():
+            value = getattr(cache, attribute)
+            value = value() if callable(value) else value
+            lines.append(f"{metric}{_format_labels((('cache', cache_name),))} {value}")
+
+    rss = max_rss_bytes()
+    if rss is not None:
+        lines += [
+            "# HELP pyfair_process_max_resident_memory_bytes Peak resident set size.",
+            "# TYPE pyfair_process_max_resident_memory_bytes gauge",
+            f"pyfair_process_max_resident_memory_bytes {rss}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """
+    Serves /metrics on a daemon thread, once per process.
+
+    Returns:
+        - ThreadingHTTPServer: The running server
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(
+                target=_server.serve_forever, name="metrics-server", daemon=True
+            ).start()
+    return _server
+
+
+def serve_from_env():
+    """Starts the metrics server if PYFAIR_METRICS_PORT is set."""
+    port = os.environ.get("PYFAIR_METRICS_PORT")
+    if port:
+        try:
+            return start_metrics_server(
+                int(port), os.environ.get("PYFAIR_METRICS_HOST", "127.0.0.1")
+            )
+        except OSError as e:
+            logger.warning("Metrics server not started on port %s: %s", port, e)
+    return None
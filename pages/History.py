@@ -0,0 +1,83 @@
+import streamlit as st
+
+import export
+import store
+import summary
+
+st.set_page_config(
+    layout="wide"
+)
+st.title("Past Runs")
+st.write(
+    "Calculations saved from the main page (with Save runs ticked) are kept in "
+    f"the result store at {store.STORE.root}. They reload from disk without "
+    "re-simulating. Only the most recent runs are kept, and runs can only be "
+    "deleted by the session that saved them."
+)
+
+runs = store.STORE.runs()
+if runs.empty:
+    st.info("No runs saved yet.")
+    st.stop()
+
+st.dataframe(runs, use_container_width=True)
+
+
+def describe(run_id):
+    run = runs.loc[run_id]
+    return (
+        f"{run['Created']:%Y-%m-%d %H:%M:%S} | {run['Label'] or run['Models']} "
+        f"| {run['Simulations']:,} simulations"
+    )
+
+
+labels = {describe(run_id): run_id for run_id in runs.index}
+selected = [
+    labels[label]
+    for label in st.multiselect(
+        "Runs to compare", list(labels), default=list(labels)[:1]
+    )
+]
+if selected:
+    # Only each model's Risk row is read from the mapped files
+    comparison = store.STORE.compare(selected)
+    comparison.index = comparison.index.set_levels(
+        [describe(run_id) for run_id in comparison.index.levels[0]], level=0
+    )
+    st.dataframe(comparison.style.format("{:,.0f}"), use_container_width=True)
+    headlines = {}
+    for run_id in selected:
+        risks = store.STORE.risks(run_id)
+        name = "Meta Model" if "Meta Model" in risks else next(iter(risks))
+        # Chart series names must not contain colons, so runs go by id here
+        headlines[f"{run_id[:8]} | {name}"] = risks[name]
+    st.line_chart(summary.exceedance_curve(headlines))
+
+for run_id in selected:
+    with st.expander(describe(run_id)):
+        st.json(store.STORE.parameters(run_id), expanded=False)
+        export_format = st.selectbox(
+            "Export format", options=list(export.EXPORT_FORMATS), key=f"format_{run_id}"
+        )
+        build, file_name, mime = export.EXPORT_FORMATS[export_format]
+        if export.is_cached(run_id, export_format) or st.button(
+            "Prepare Export", key=f"export_{run_id}"
+        ):
+            with st.spinner(f"Writing {export_format}..."):
+                output = export.cached_export(
+                    run_id, export_format, lambda: build(store.STORE.load(run_id))
+                )
+            st.download_button(
+                label=f"Download as {export_format}",
+                data=output,
+                file_name=file_name,
+                mime=mime,
+                key=f"download_{run_id}",
+            )
+        # Sessions can only delete the runs they saved themselves
+        if run_id in st.session_state.get("saved_runs", ()) and st.button(
+            "Delete Run", key=f"delete_{run_id}"
+        ):
+            store.STORE.delete(run_id)
+            st.session_state["saved_runs"].discard(run_id)
+            st.rerun()
@@ -0,0 +1,205 @@
+import time
+import uuid
+
+import pandas as pd
+import streamlit as st
+
+import aggregation
+import engine
+import export
+import jobs
+import portfolio
+import summary
+from cache import RESULT_CACHE
+from main import calculate_portfolio, portfolio_cache_key
+
+# Column headings of each field prefix in the scenario table
+LABELS = {
+    "lm": "LM (£m)",
+    "tef": "TEF",
+    "contact": "Contact",
+    "action": "Action",
+    "vuln": "Vuln",
+    "threat": "Threat Cap",
+    "control": "Control",
+}
+
+st.set_page_config(
+    layout="wide"
+)
+st.title("Risk Portfolio")
+st.write(
+    "Add a row per risk scenario. Every scenario is simulated in one batch and "
+    "their annual losses are summed into the portfolio total."
+)
+provided1, provided2 = st.columns(spec=2)
+with provided1:
+    use_tef = st.checkbox("Use TEF", value=True)
+with provided2:
+    use_vuln = st.checkbox("Use Vulnerability", value=True)
+simulations = st.slider(
+    "Number of Simulations", min_value=10000, max_value=100000, step=10000
+)
+seed = st.number_input(
+    "Random Seed",
+    min_value=0,
+    max_value=2**32 - 1,
+    value=42,
+    step=1,
+    help="Each scenario draws from its own stream derived from this seed and its row.",
+)
+
+column_config = {"Scenario": st.column_config.TextColumn("Scenario", required=True)}
+for target, prefix in portfolio.node_prefixes(use_tef, use_vuln).items():
+    for parameter in ("low", "mode", "high"):
+        column_config[f"{prefix}_{parameter}"] = st.column_config.NumberColumn(
+            f"{LABELS[prefix]} {parameter}",
+            min_value=0.0,
+            max_value=1.0 if target in engine.LE_1_TARGETS else None,
+            required=True,
+        )
+scenarios = st.data_editor(
+    portfolio.default_scenarios(use_tef, use_vuln),
+    num_rows="dynamic",
+    column_config=column_config,
+    hide_index=True,
+    use_container_width=True,
+    key=f"scenarios_{use_tef}_{use_vuln}",
+)
+scenarios = scenarios.to_dict(orient="records")
+compact = engine.compact_results()
+result_key = portfolio_cache_key(
+    scenarios, use_tef, use_vuln, simulations, seed, compact
+)
+
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+if st.button("Calculate"):
+    if "portfolio_job" in st.session_state:
+        jobs.JOBS.release(st.session_state.pop("portfolio_job"), session_id)
+    calculation = dict(
+        scenarios=scenarios,
+        use_tef=use_tef,
+        use_vuln=use_vuln,
+        simulations=simulations,
+        seed=seed,
+        compact=compact,
+    )
+    if not scenarios:
+        st.error("Add at least one scenario.")
+    elif result_key in RESULT_CACHE:
+        st.session_state["portfolio_results"] = (
+            result_key,
+            calculate_portfolio(**calculation),
+        )
+    else:
+        job = jobs.JOBS.submit(
+            result_key,
+            lambda report: calculate_portfolio(progress=report, **calculation),
+            owner=session_id,
+        )
+        st.session_state["portfolio_job"] = job.id
+
+# Follow or collect this session's background job, as on the main page
+job_id = st.session_state.get("portfolio_job")
+job = jobs.JOBS.get(job_id) if job_id else None
+if job_id and (job is None or job.key != result_key):
+    jobs.JOBS.release(st.session_state.pop("portfolio_job"), session_id)
+elif job is not None:
+    if job.status == jobs.DONE:
+        st.session_state["portfolio_results"] = (result_key, job.result)
+        jobs.JOBS.release(st.session_state.pop("portfolio_job"), session_id)
+    elif job.status == jobs.FAILED:
+        st.error(f"Error generating portfolio: {job.error}")
+        jobs.JOBS.release(st.session_state.pop("portfolio_job"), session_id)
+    elif job.cancelled:
+        st.warning("Calculation cancelled")
+        jobs.JOBS.release(st.session_state.pop("portfolio_job"), session_id)
+    else:
+        st.progress(job.progress, text=job.message)
+        if st.button("Cancel"):
+            jobs.JOBS.release(st.session_state.pop("portfolio_job"), session_id)
+            st.warning("Calculation cancelled")
+        else:
+            time.sleep(jobs.POLL_INTERVAL)
+            st.rerun()
+
+stored = st.session_state.get("portfolio_results")
+if stored and stored[0] == result_key:
+    result = stored[1]
+    st.success(f"Simulated {len(result.names)} scenarios")
+    table = result.summary()
+    total = table.loc[portfolio.TOTAL]
+    for column, label in zip(st.columns(4), ("Mean", "P90", "VaR 99%", "ES 99%")):
+        column.metric(
+            "Portfolio " + (label if label != "Mean" else "ALE"),
+            f"GBP {total[label]:,.0f}",
+        )
+    st.line_chart(summary.exceedance_curve({portfolio.TOTAL: result.total}))
+    # Largest risks first, under the portfolio total
+    table = pd.concat(
+        [table.iloc[:1], table.iloc[1:].sort_values("Mean", ascending=False)]
+    )
+    st.dataframe(table.style.format("{:,.0f}"), use_container_width=True)
+
+    st.download_button(
+        label="Download Summary (CSV)",
+        data=table.to_csv(index_label="Scenario").encode("utf-8"),
+        file_name="portfolio_summary.csv",
+        mime="text/csv",
+    )
+
+    # Scenarios were drawn independently; reorder them to a rank correlation
+    st.subheader("Correlated Portfolio")
+    setting1, setting2 = st.columns(spec=2)
+    with setting1:
+        correlation = st.slider(
+            "Rank correlation between scenarios",
+            min_value=0.0,
+            max_value=0.95,
+            value=0.0,
+            step=0.05,
+            help="Spearman correlation applied to every pair of scenarios.",
+        )
+    with setting2:
+        method = st.selectbox("Method", list(aggregation.METHODS))
+    try:
+        with st.spinner("Aggregating..."):
+            correlated, contributions = result.aggregate(correlation, method, seed)
+    except ValueError as e:
+        st.error(f"Error aggregating portfolio: {e}")
+    else:
+        stats = summary.ale_summary(correlated)
+        for column, label in zip(st.columns(3), ("VaR 95%", "VaR 99%", "ES 99%")):
+            column.metric(
+                label,
+                f"GBP {stats[label]:,.0f}",
+                delta=f"{stats[label] - total[label]:,.0f} vs independent",
+                delta_color="inverse",
+            )
+        st.line_chart(
+            summary.exceedance_curve(
+                {"Independent": result.total, "Correlated": correlated}
+            )
+        )
+        st.dataframe(
+            contributions.sort_values(
+                "VaR 99% contribution", ascending=False
+            ).style.format("{:,.0f}"),
+            use_container_width=True,
+        )
+
+    if export.is_cached(result_key, "Parquet") or st.button(
+        "Prepare Simulation Export"
+    ):
+        with st.spinner("Writing Parquet..."):
+            output = export.cached_export(
+                result_key,
+                "Parquet",
+                lambda: export.simulation_parquet({"Portfolio": result.to_frame()}),
+            )
+        st.download_button(
+            label="Download Simulation as Parquet",
+            data=output,
+            file_name="portfolio_parquet.zip",
+            mime="application/zip",
+        )
@@ -0,0 +1,131 @@
+"""
+Concurrent simulation of several FAIR models on a process pool.
+
+Workers write each model's result matrix straight into a shared memory block
+allocated by the parent, so only the small input dicts are pickled and the
+simulated arrays never cross the process boundary as DataFrames. The pool is
+created lazily, once per process, and reused by every Streamlit session.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import engine
+
+# Below this many draws in total the pool overhead outweighs the speed-up
+MIN_PARALLEL_DRAWS = 200_000
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def max_workers():
+    """Number of worker processes, defaulting to the available CPU count."""
+    return int(os.environ.get("PYFAIR_WORKERS", 0)) or os.cpu_count() or 1
+
+
+def get_pool():
+    """Returns the shared process pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Start the tracker before workers exist so they share it and
+            # segments unlinked by the parent are not reported as leaked.
+            resource_tracker.ensure_running()
+            # Spawn rather than fork: the Streamlit server is multi-threaded.
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            atexit.register(shutdown_pool)
+        return _pool
+
+
+def shutdown_pool():
+    """Shuts the shared process pool down, if it was started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def should_parallelize(n_models, n_simulations):
+    """Whether running n_models concurrently is expected to be faster."""
+    return (
+        n_models > 1
+        and max_workers() > 1
+        and n_models * n_simulations >= MIN_PARALLEL_DRAWS
+    )
+
+
+def _simulate_into_shared_memory(
+    shm_name, shape, inputs, n_simulations, random_seed, sampler=engine.MONTE_CARLO
+):
+    """Worker entry point: simulates one model into an existing shared block."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        engine.simulate_model(
+            inputs, n_simulations, random_seed=random_seed, out=out, sampler=sampler
+        )
+        del out
+    finally:
+        shm.close()
+
+
+def simulate_models(
+    model_inputs, n_simulations, random_seeds, sampler=engine.MONTE_CARLO
+):
+    """
+    Simulates several models concurrently.
+
+    Parameters:
+        - model_inputs (list): One engine input dict per model
+        - n_simulations (int): Number of draws per node
+        - random_seeds (list): One seed per model
+        - sampler (str): One of engine.SAMPLERS
+
+    Returns:
+        - list: A SimulationResult per model, in the order given
+    """
+    layouts = [engine.model_layout(inputs) for inputs in model_inputs]
+    blocks = []
+    try:
+        futures = []
+        pool = get_pool()
+        for inputs, seed, (columns, _) in zip(model_inputs, random_seeds, layouts):
+            shape = (len(columns), n_simulations)
+            shm = shared_memory.SharedMemory(
+                create=True, size=int(np.prod(shape)) * np.float64().itemsize
+            )
+            blocks.append(shm)
+            futures.append(
+                pool.submit(
+                    _simulate_into_shared_memory,
+                    shm.name,
+                    shape,
+                    inputs,
+                    n_simulations,
+                    seed,
+                    sampler,
+                )
+            )
+        results = []
+        for future, shm, (columns, calculated) in zip(futures, blocks, layouts):
+            future.result()
+            shape = (len(columns), n_simulations)
+            # Copy out so the segment can be released immediately
+            values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf).copy()
+            results.append(engine.SimulationResult(columns, values, calculated))
+        return results
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,256 @@
+"""
+Portfolio of any number of risk scenarios, simulated as one batch.
+
+Every scenario shares the node layout chosen with use_tef/use_vuln, so the
+whole portfolio is simulated with array operations across scenarios rather
+than one FairModel at a time: each node's Beta-PERT inverse CDF is
+tabulated for every scenario at once and applied to uniform draws (see
+engine.pert_ppf_rows). Only each scenario's Risk is kept, together with
+their sum, which is the portfolio total a FairMetaModel of the scenarios
+would report.
+
+Scenario i draws its uniforms from the stream of engine.model_seed(seed, i),
+so adding or removing scenarios below it never changes its results. Values
+agree with the per-model engine in distribution, not draw for draw, and are
+accurate to within engine.PPF_MAX_ERROR of each input's range.
+"""
+
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+import aggregation
+import engine
+import summary
+
+# Draws (scenarios x simulations) generated per node at once, bounding memory
+BLOCK_DRAWS = 500_000
+TOTAL = "Portfolio"
+
+
+def node_prefixes(use_tef, use_vuln):
+    """Maps each input node to its field prefix (lm, tef, vuln, ...), in draw order."""
+    prefixes = {"Loss Magnitude": "lm"}
+    # Input the frequency-related parameters based on whether TEF is used
+    if use_tef:
+        prefixes["Threat Event Frequency"] = "tef"
+    else:
+        prefixes["Contact Frequency"] = "contact"
+        prefixes["Probability of Action"] = "action"
+    # Input the vulnerability/threat-related parameters based on whether vulnerability is used
+    if use_vuln:
+        prefixes["Vulnerability"] = "vuln"
+    else:
+        prefixes["Threat Capability"] = "threat"
+        prefixes["Control Strength"] = "control"
+    return prefixes
+
+
+# Starting values of each field, as on the main page (LM in £ million)
+DEFAULTS = {
+    "lm": (0.1, 0.5, 1.0),
+    "tef": (0, 2, 12),
+    "contact": (2, 5, 20),
+    "action": (0.0, 0.15, 0.2),
+    "vuln": (0.01, 0.3, 0.5),
+    "threat": (0.5, 0.7, 0.9),
+    "control": (0.75, 0.8, 0.9),
+}
+
+
+def scenario_columns(use_tef, use_vuln):
+    """Input columns of a scenario table, e.g. lm_low, lm_mode, lm_high, ..."""
+    return [
+        f"{prefix}_{parameter}"
+        for prefix in node_prefixes(use_tef, use_vuln).values()
+        for parameter in ("low", "mode", "high")
+    ]
+
+
+def default_scenarios(use_tef, use_vuln, n_scenarios=2):
+    """A scenario table prefilled with the main page's default inputs."""
+    row = {
+        f"{prefix}_{parameter}": value
+        for prefix in node_prefixes(use_tef, use_vuln).values()
+        for parameter, value in zip(("low", "mode", "high"), DEFAULTS[prefix])
+    }
+    return pd.DataFrame(
+        [{"Scenario": f"Risk {i + 1}", **row} for i in range(n_scenarios)]
+    )
+
+
+def scenario_inputs(row, use_tef, use_vuln):
+    """
+    Engine inputs for one scenario table row.
+
+    Loss Magnitude is entered in £ million and converted to pounds as the
+    main page does. Empty cells become None, which engine.check_inputs
+    reports as a missing value.
+    """
+    inputs = {}
+    for target, prefix in node_prefixes(use_tef, use_vuln).items():
+        params = {}
+        for parameter in ("low", "mode", "high"):
+            value = row.get(f"{prefix}_{parameter}")
+            if value is None or pd.isna(value):
+                value = None
+            elif prefix == "lm":
+                value = float(Decimal(float(value)) * Decimal(1000000.00))
+            else:
+                value = float(value)
+            params[parameter] = value
+        inputs[target] = params
+    return inputs
+
+
+def check_names(names):
+    """
+    Raises ValueError if scenario names repeat or one is TOTAL, which would
+    overwrite the total in summaries and duplicate its export column.
+    """
+    if len(set(names)) != len(names):
+        raise ValueError("Scenario names must be unique.")
+    if TOTAL in names:
+        raise ValueError(f'"{TOTAL}" is reserved for the total of all scenarios.')
+
+
+class PortfolioResult:
+    """
+    Simulated annual loss of every scenario and of the whole portfolio.
+
+    ``values`` has one row per scenario followed by the total, so to_frame
+    can expose it as a FairMetaModel-style risk table without copying.
+    """
+
+    def __init__(self, names, values):
+        self.names = list(names)
+        self.values = values
+        self._summary = None
+        self._aggregate = None
+
+    @property
+    def n_simulations(self):
+        return self.values.shape[1]
+
+    @property
+    def risk(self):
+        """Scenario rows of simulated Risk."""
+        return self.values[:-1]
+
+    @property
+    def total(self):
+        """Summed Risk of all scenarios."""
+        return self.values[-1]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def to_frame(self):
+        """One Risk column per scenario plus the total, as in FairMetaModel."""
+        return pd.DataFrame(self.values.T, columns=self.names + [TOTAL], copy=False)
+
+    def summary(self):
+        """
+        summary.summary_table for the total and each scenario, total first.
+
+        Computed on first use and kept, since it sorts every row.
+        """
+        if self._summary is None:
+            self._summary = summary.summary_table(
+                {TOTAL: self.total, **dict(zip(self.names, self.risk))}
+            )
+        return self._summary
+
+    def aggregate(self, correlation=0.0, method="Iman-Conover", random_seed=0):
+        """
+        aggregation.aggregate of the scenarios under a rank correlation.
+
+        The latest call is kept, so reruns with unchanged settings are free.
+        Results are shared by every session, so the memo is only ever read
+        or replaced whole.
+
+        Returns:
+            - total (np.ndarray): Correlated portfolio loss per simulation
+            - table (pd.DataFrame): Mean and VaR/ES contributions per scenario
+        """
+        settings = (correlation, method, random_seed)
+        memo = self._aggregate
+        if memo is not None and memo[0] == settings:
+            return memo[1]
+        aggregated = aggregation.aggregate(
+            self.names, self.risk, correlation, method, random_seed
+        )
+        self._aggregate = (settings, aggregated)
+        return aggregated
+
+
+def simulate_portfolio(
+    names,
+    model_inputs,
+    n_simulations,
+    random_seed=42,
+    compact=False,
+    progress=None,
+    random_seeds=None,
+):
+    """
+    Simulates the Risk of many scenarios sharing one node layout.
+
+    Parameters:
+        - names (list): Scenario names
+        - model_inputs (list): Engine input dict per scenario
+        - n_simulations (int): Draws per scenario
+        - random_seed (int): Run seed; scenario i uses engine.model_seed
+        - compact (bool): Store results as engine.COMPACT_DTYPE (float32)
+        - progress (callable): Optional progress(fraction, message), called
+          before each block of scenarios
+        - random_seeds (list): Optional seed per scenario, used instead of
+          those derived from random_seed, so a scenario's draws do not
+          depend on its position (see api.py)
+
+    Returns:
+        - PortfolioResult
+    """
+    if not model_inputs:
+        raise ValueError("A portfolio needs at least one scenario.")
+    check_names(names)
+    targets = list(model_inputs[0])
+    for inputs in model_inputs:
+        engine.model_layout(inputs)
+        if list(inputs) != targets:
+            raise ValueError("Every scenario must supply the same input nodes.")
+    report = progress or (lambda fraction, message: None)
+    random_seeds = random_seeds or [
+        engine.model_seed(random_seed, i) for i in range(len(model_inputs))
+    ]
+
+    n_scenarios = len(model_inputs)
+    dtype = engine.COMPACT_DTYPE if compact else np.float64
+    values = np.empty((n_scenarios + 1, n_simulations), dtype=dtype)
+    total = np.zeros(n_simulations)
+    block = max(BLOCK_DRAWS // max(n_simulations, 1), 1)
+    for start in range(0, n_scenarios, block):
+        stop = min(start + block, n_scenarios)
+        report(start / n_scenarios, f"Simulating scenarios {start + 1}-{stop}")
+        uniforms = np.empty((len(targets), stop - start, n_simulations))
+        for row, i in enumerate(range(start, stop)):
+            rng = np.random.default_rng(random_seeds[i])
+            uniforms[:, row] = rng.random((len(targets), n_simulations))
+        nodes = {
+            target: engine.pert_ppf_rows(
+                uniforms[k],
+                target,
+                *(
+                    [model_inputs[i][target][parameter] for i in range(start, stop)]
+                    for parameter in ("low", "mode", "high")
+                ),
+            )
+            for k, target in enumerate(targets)
+        }
+        risk = engine.risk_from_inputs(nodes)
+        values[start:stop] = risk
+        total += risk.sum(axis=0)
+    values[-1] = total
+    return PortfolioResult(names, values)
@@ -0,0 +1,118 @@
+"""
+One-at-a-time sensitivity (tornado) analysis using common random numbers.
+
+Every input node gets one fixed set of uniform draws. The base case and each
+perturbed case map those same uniforms through the node's Beta-PERT inverse
+CDF, so a perturbation only re-transforms the node it touches and the change
+in ALE reflects the parameter, not fresh sampling noise. Each case costs one
+inverse-CDF table and a few vector operations instead of a full simulation.
+"""
+
+import numpy as np
+import pandas as pd
+
+import engine
+
+DEFAULT_SWING = 0.1
+PARAMETERS = ("low", "mode", "high")
+
+
+def shift_parameter(target, params, parameter, delta):
+    """
+    Returns a copy of params with one of low/mode/high moved by delta.
+
+    The result is clamped so the ordering low <= mode <= high still holds
+    and the value stays within the node's allowed range.
+    """
+    shifted = dict(params)
+    value = params[parameter] + delta
+    if parameter == "low":
+        value = min(value, params["mode"])
+    elif parameter == "mode":
+        value = min(max(value, params["low"]), params["high"])
+    else:
+        value = max(value, params["mode"])
+    if target in engine.LE_1_TARGETS:
+        value = min(value, 1.0)
+    shifted[parameter] = max(value, 0.0)
+    return shifted
+
+
+def tornado(
+    inputs, n_simulations, random_seed=42, swing=DEFAULT_SWING, statistic=np.mean
+):
+    """
+    Measures how far each input parameter moves ALE.
+
+    Parameters:
+        - inputs (dict): Engine input dict for one model
+        - n_simulations (int): Draws shared by every case
+        - random_seed (int): Seed for the common uniform draws
+        - swing (float): Each parameter is moved down and up by this
+          fraction of its node's high - low range
+        - statistic (callable): Reduces the Risk draws to one number
+
+    Returns:
+        - base (float): Statistic of Risk with the inputs as given
+        - table (pd.DataFrame): One row per node and parameter, sorted by
+          Swing (the absolute difference between the Down and Up cases)
+    """
+    # Deferred like pyfair in engine, to keep it off the cold-start path
+    from pyfair.utility.fair_exception import FairException
+
+    targets = list(inputs)
+    uniforms = np.random.RandomState(random_seed).random_sample(
+        (len(targets), n_simulations)
+    )
+    positions = [engine.ppf_positions(row) for row in uniforms]
+    base_values = {
+        target: engine.pert_ppf(
+            uniforms[i], target, **inputs[target], positions=positions[i]
+        )
+        for i, target in enumerate(targets)
+    }
+    base = float(statistic(engine.risk_from_inputs(base_values)))
+
+    rows = []
+    for i, target in enumerate(targets):
+        params = inputs[target]
+        delta = swing * (params["high"] - params["low"])
+        for parameter in PARAMETERS:
+            row = {"Node": target, "Parameter": parameter, "Value": params[parameter]}
+            for label, sign in (("Down", -1), ("Up", 1)):
+                shifted = shift_parameter(target, params, parameter, sign * delta)
+                row[f"{label} Value"] = shifted[parameter]
+                try:
+                    values = {
+                        **base_values,
+                        target: engine.pert_ppf(
+                            uniforms[i], target, **shifted, positions=positions[i]
+                        ),
+                    }
+                    row[f"{label} ALE"] = float(
+                        statistic(engine.risk_from_inputs(values))
+                    )
+                except FairException:
+                    # The shift collapsed the distribution (low == high)
+                    row[f"{label} ALE"] = np.nan
+            row["Swing"] = abs(row["Up ALE"] - row["Down ALE"])
+            rows.append(row)
+    table = pd.DataFrame(rows).sort_values("Swing", ascending=False, ignore_index=True)
+    return base, table
+
+
+def tornado_figure(base, table, currency_prefix="GBP "):
+    """Draws a tornado chart of ALE for the parameter shifts in table."""
+    from matplotlib.figure import Figure
+
+    table = table.dropna(subset=["Swing"]).iloc[::-1]
+    labels = table["Node"] + " (" + table["Parameter"] + ")"
+    fig = Figure(figsize=(8, 0.35 * len(table) + 1.2))
+    ax = fig.subplots()
+    ax.barh(labels, table["Down ALE"] - base, left=base, label="Parameter decreased")
+    ax.barh(labels, table["Up ALE"] - base, left=base, label="Parameter increased")
+    ax.axvline(base, color="black", linewidth=1)
+    ax.set_xlabel(f"Mean annual loss ({currency_prefix.strip()})")
+    ax.legend(loc="lower right")
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,324 @@
+"""
+Persistent store of past calculate_risk runs.
+
+Each run's simulated results outlive the session that produced them: run
+and model metadata (parameters, engine inputs, column names) go in a SQLite
+database, and every model's simulated columns in a .npy file laid out one
+column per row. Reloading a run memory-maps those files, so nothing is
+re-simulated or parsed, only the pages actually read (e.g. just each
+model's Risk row when comparing runs) are loaded from disk, and the
+returned DataFrames view the mapped arrays without copying.
+
+The store lives in PYFAIR_STORE_DIR, by default ~/.pyfair/runs. It keeps at
+most PYFAIR_STORE_MAX_RUNS runs (default MAX_RUNS) and PYFAIR_STORE_MAX_BYTES
+of result files (default MAX_BYTES); older runs are pruned as new ones are
+saved.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+import summary
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    key TEXT UNIQUE,
+    label TEXT,
+    created REAL NOT NULL,
+    n_simulations INTEGER NOT NULL,
+    parameters TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS models (
+    run_id TEXT NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    file TEXT NOT NULL,
+    columns TEXT NOT NULL,
+    inputs TEXT,
+    PRIMARY KEY (run_id, position)
+);
+"""
+# Default retention limits, overridden by PYFAIR_STORE_MAX_RUNS and
+# PYFAIR_STORE_MAX_BYTES
+MAX_RUNS = 200
+MAX_BYTES = 2 * 2**30
+
+
+def default_root():
+    """Store directory: PYFAIR_STORE_DIR, else ~/.pyfair/runs."""
+    return os.environ.get("PYFAIR_STORE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".pyfair", "runs"
+    )
+
+
+class ResultStore:
+    """
+    SQLite-indexed directory of memory-mappable simulation results.
+
+    Nothing touches the disk until the store is first used. Every call
+    opens its own SQLite connection, so one store can be shared by all
+    sessions and job threads.
+
+    Parameters:
+        - root (str): Store directory; defaults to default_root()
+        - max_runs (int): Runs kept; older ones are pruned on save
+        - max_bytes (int): Total size of result files kept; the newest run
+          is always kept, however large
+    """
+
+    def __init__(self, root=None, max_runs=None, max_bytes=None):
+        self.root = root or default_root()
+        self.max_runs = (
+            max_runs or int(os.environ.get("PYFAIR_STORE_MAX_RUNS", 0)) or MAX_RUNS
+        )
+        self.max_bytes = (
+            max_bytes or int(os.environ.get("PYFAIR_STORE_MAX_BYTES", 0)) or MAX_BYTES
+        )
+        self._ready = False
+        self._lock = threading.Lock()
+
+    @property
+    def db_path(self):
+        return os.path.join(self.root, "runs.sqlite")
+
+    def _connect(self):
+        with self._lock:
+            if not self._ready:
+                os.makedirs(os.path.join(self.root, "arrays"), exist_ok=True)
+                with closing(sqlite3.connect(self.db_path)) as db:
+                    db.executescript(SCHEMA)
+                self._ready = True
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.execute("PRAGMA foreign_keys = ON")
+        return db
+
+    def save(self, frames, parameters, key=None, label=None, inputs=None):
+        """
+        Saves one run, unless a run with the same key is already stored.
+
+        Parameters:
+            - frames (dict): Model name -> export_results() DataFrame, in
+              order; all-NaN columns (nodes the model did not use) are
+              dropped
+            - parameters (dict): JSON-serialisable calculate_risk arguments
+            - key (str): Identifies the run's parameter set, e.g.
+              main.risk_cache_key
+            - label (str): Optional description shown when listing runs
+            - inputs (dict): Optional model name -> engine input dict
+
+        Returns:
+            - str: Id of the saved (or already stored) run
+        """
+        if key is not None:
+            existing = self.find(key)
+            if existing is not None:
+                return existing
+        run_id = uuid.uuid4().hex
+        directory = os.path.join(self.root, "arrays", run_id)
+        rows = []
+        with closing(self._connect()) as db:
+            os.makedirs(directory)
+            try:
+                for position, (name, frame) in enumerate(frames.items()):
+                    file = os.path.join(run_id, f"{position}.npy")
+                    columns = [c for c in frame.columns if frame[c].notna().any()]
+                    _write_columns(
+                        os.path.join(self.root, "arrays", file), frame, columns
+                    )
+                    rows.append(
+                        (
+                            run_id,
+                            position,
+                            name,
+                            file,
+                            json.dumps(columns),
+                            json.dumps((inputs or {}).get(name)),
+                        )
+                    )
+                with db:
+                    db.execute(
+                        "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            run_id,
+                            key,
+                            label,
+                            time.time(),
+                            len(next(iter(frames.values()))),
+                            json.dumps(parameters, default=str),
+                        ),
+                    )
+                    db.executemany("INSERT INTO models VALUES (?, ?, ?, ?, ?, ?)", rows)
+            except sqlite3.IntegrityError:
+                # Another thread stored the same key first
+                shutil.rmtree(directory, ignore_errors=True)
+                return self.find(key)
+            except BaseException:
+                shutil.rmtree(directory, ignore_errors=True)
+                raise
+        self.prune()
+        return run_id
+
+    def prune(self):
+        """
+        Deletes the oldest runs beyond max_runs or max_bytes.
+
+        Returns:
+            - list: Ids of the deleted runs
+        """
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT runs.id, group_concat(file, char(10))"
+                " FROM runs JOIN models ON models.run_id = runs.id"
+                " GROUP BY runs.id ORDER BY created DESC"
+            ).fetchall()
+        deleted = []
+        nbytes = 0
+        for position, (run_id, files) in enumerate(rows):
+            nbytes += sum(_file_size(self._path(file)) for file in files.split("\n"))
+            if position >= self.max_runs or (position and nbytes > self.max_bytes):
+                self.delete(run_id)
+                deleted.append(run_id)
+        return deleted
+
+    def find(self, key):
+        """Id of the run stored under key, or None."""
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT id FROM runs WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def runs(self):
+        """
+        Lists the stored runs, newest first.
+
+        Returns:
+            - pd.DataFrame: Indexed by run id, with Created, Label,
+              Simulations and Models columns
+        """
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT runs.id, created, label, n_simulations, group_concat(name, ', ')"
+                " FROM runs JOIN models ON models.run_id = runs.id"
+                " GROUP BY runs.id ORDER BY created DESC"
+            ).fetchall()
+        return pd.DataFrame(
+            [
+                {
+                    "Run": run_id,
+                    "Created": datetime.datetime.fromtimestamp(created),
+                    "Label": label,
+                    "Simulations": n_simulations,
+                    "Models": models,
+                }
+                for run_id, created, label, n_simulations, models in rows
+            ],
+            columns=["Run", "Created", "Label", "Simulations", "Models"],
+        ).set_index("Run")
+
+    def parameters(self, run_id):
+        """The calculate_risk arguments a run was saved with."""
+        with closing(self._connect()) as db:
+            row = db.execute(
+                "SELECT parameters FROM runs WHERE id = ?", (run_id,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(run_id)
+        return json.loads(row[0])
+
+    def inputs(self, run_id):
+        """Model name -> engine input dict (None where not saved)."""
+        return {name: json.loads(inputs) for name, _, _, inputs in self._models(run_id)}
+
+    def _models(self, run_id):
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT name, file, columns, inputs FROM models"
+                " WHERE run_id = ? ORDER BY position",
+                (run_id,),
+            ).fetchall()
+        if not rows:
+            raise KeyError(run_id)
+        return rows
+
+    def _path(self, file):
+        return os.path.join(self.root, "arrays", file)
+
+    def _map(self, file):
+        return np.load(self._path(file), mmap_mode="r")
+
+    def load(self, run_id):
+        """
+        Memory-maps a run's results.
+
+        Returns:
+            - dict: Model name -> read-only DataFrame of its simulated
+              columns, backed by the mapped file
+        """
+        return {
+            name: pd.DataFrame(
+                self._map(file).T, columns=json.loads(columns), copy=False
+            )
+            for name, file, columns, _ in self._models(run_id)
+        }
+
+    def risks(self, run_id):
+        """Model name -> memory-mapped Risk row of a run, reading nothing else."""
+        risks = {}
+        for name, file, columns, _ in self._models(run_id):
+            columns = json.loads(columns)
+            if "Risk" in columns:
+                risks[name] = self._map(file)[columns.index("Risk")]
+        return risks
+
+    def compare(self, run_ids):
+        """
+        summary.ale_summary of every model of several runs.
+
+        Returns:
+            - pd.DataFrame: Indexed by (run id, model name)
+        """
+        tables = {
+            run_id: summary.summary_table(self.risks(run_id)) for run_id in run_ids
+        }
+        return pd.concat(tables, names=["Run", "Model"])
+
+    def delete(self, run_id):
+        """Removes a run and its files."""
+        with closing(self._connect()) as db:
+            with db:
+                db.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+        shutil.rmtree(os.path.join(self.root, "arrays", run_id), ignore_errors=True)
+
+
+def _write_columns(path, frame, columns):
+    """Writes columns of frame as one row each, atomically, in the frame's dtype."""
+    dtype = np.result_type(*(frame[column].dtype for column in columns))
+    partial = path + ".partial"
+    out = np.lib.format.open_memmap(
+        partial, mode="w+", dtype=dtype, shape=(len(columns), len(frame))
+    )
+    for row, column in zip(out, columns):
+        row[:] = frame[column].to_numpy()
+    out.flush()
+    del out
+    os.replace(partial, path)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+STORE = ResultStore()
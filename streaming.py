@@ -0,0 +1,250 @@
+"""
+Chunked simulation for very large simulation counts.
+
+Draws are generated and aggregated in fixed-size chunks and only running
+summaries are kept, so memory is bounded by the chunk size rather than the
+total number of simulations, and refined results are available after every
+chunk.
+"""
+
+import numpy as np
+import pandas as pd
+
+import engine
+
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_BINS = 8192
+QUANTILES = (0.05, 0.5, 0.9, 0.95, 0.99)
+
+
+class RunningSummary:
+    """
+    Mergeable summary of a stream of non-negative values with a known bound.
+
+    Count, mean and variance are combined exactly. Quantiles come from a
+    fixed-bin histogram over [0, upper], interpolated within the bin, so
+    each reported quantile is within one bin width (upper / n_bins) of the
+    exact sample quantile. Summaries built with the same bound and bin
+    count can be merged.
+    """
+
+    def __init__(self, upper, n_bins=DEFAULT_BINS):
+        self.upper = float(upper) if upper > 0 else 1.0
+        self.n_bins = n_bins
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.count = 0
+        self.mean = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self._m2 = 0.0
+
+    @property
+    def bin_width(self):
+        return self.upper / self.n_bins
+
+    @property
+    def edges(self):
+        return np.linspace(0.0, self.upper, self.n_bins + 1)
+
+    @property
+    def std(self):
+        """Sample standard deviation (ddof=1, as pandas reports)."""
+        return float(np.sqrt(self._m2 / (self.count - 1))) if self.count > 1 else 0.0
+
+    def update(self, values):
+        """Adds an array of values to the summary."""
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return
+        mean = float(values.mean())
+        m2 = float(np.square(values - mean).sum())
+        index = np.minimum((values / self.bin_width).astype(np.int64), self.n_bins - 1)
+        counts = np.bincount(index, minlength=self.n_bins)
+        self._combine(
+            values.size, mean, m2, float(values.min()), float(values.max()), counts
+        )
+
+    def merge(self, other):
+        """Folds another summary with the same bound and bin count into this one."""
+        if other.n_bins != self.n_bins or other.upper != self.upper:
+            raise ValueError("Cannot merge summaries with different histograms.")
+        if other.count:
+            self._combine(
+                other.count, other.mean, other._m2, other.min, other.max, other.counts
+            )
+        return self
+
+    def _combine(self, count, mean, m2, minimum, maximum, counts):
+        """Chan et al. parallel update of count, mean and sum of squares."""
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self._m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+        self.counts += counts
+
+    def quantile(self, q):
+        """Approximate q-quantile, accurate to within one bin width."""
+        if not self.count:
+            return np.nan
+        cumulative = np.cumsum(self.counts)
+        target = q * self.count
+        i = int(np.searchsorted(cumulative, target, side="left"))
+        i = min(i, self.n_bins - 1)
+        before = cumulative[i - 1] if i else 0
+        fraction = (target - before) / self.counts[i] if self.counts[i] else 0.0
+        value = (i + fraction) * self.bin_width
+        return float(np.clip(value, self.min, self.max))
+
+    def to_dict(self):
+        """Headline statistics as a flat dict."""
+        stats = {
+            "Simulations": self.count,
+            "Mean": self.mean,
+            "Stdev": self.std,
+            "Minimum": self.min,
+            "Maximum": self.max,
+        }
+        for q in QUANTILES:
+            stats[f"P{q * 100:g}"] = self.quantile(q)
+        return stats
+
+
+def node_upper_bounds(inputs):
+    """Upper bound of every node of a model, derived from its input highs."""
+    bounds = {
+        target: (
+            min(params["high"], 1.0)
+            if target in engine.LE_1_TARGETS
+            else params["high"]
+        )
+        for target, params in inputs.items()
+    }
+    if "Threat Event Frequency" not in bounds:
+        bounds["Threat Event Frequency"] = (
+            bounds["Contact Frequency"] * bounds["Probability of Action"]
+        )
+    bounds.setdefault("Vulnerability", 1.0)
+    bounds["Loss Event Frequency"] = (
+        bounds["Threat Event Frequency"] * bounds["Vulnerability"]
+    )
+    bounds["Risk"] = bounds["Loss Event Frequency"] * bounds["Loss Magnitude"]
+    return bounds
+
+
+def chunk_sizes(n_simulations, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Splits n_simulations into chunks of at most chunk_size."""
+    full, remainder = divmod(n_simulations, chunk_size)
+    return [chunk_size] * full + ([remainder] if remainder else [])
+
+
+def chunk_seeds(random_seed, n_chunks):
+    """Independent, reproducible RandomState seeds for each chunk of a run."""
+    children = np.random.SeedSequence(random_seed).spawn(n_chunks)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def _step_vulnerability(inputs, sizes, seeds):
+    """
+    Share of all draws where Threat Capability exceeds Control Strength.
+
+    pyfair averages this step function over the whole run, so it has to be
+    known before any chunk's Loss Event Frequency can be computed. This
+    takes one extra pass over the same chunk streams.
+    """
+    hits = 0
+    for size, seed in zip(sizes, seeds):
+        result = engine.simulate_model(
+            inputs, size, random_seed=seed, vulnerability=0.0
+        )
+        hits += int(
+            np.count_nonzero(result["Control Strength"] < result["Threat Capability"])
+        )
+    return hits / sum(sizes)
+
+
+def stream_models(
+    model_inputs,
+    n_simulations,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    random_seed=42,
+    meta_model=False,
+    n_bins=DEFAULT_BINS,
+):
+    """
+    Simulates models chunk by chunk, yielding refined summaries as it goes.
+
+    Parameters:
+        - model_inputs (dict): Model name -> engine input dict
+        - n_simulations (int): Total draws per node
+        - chunk_size (int): Draws held in memory at once per model
+        - random_seed (int): Run seed. Each model's chunks draw from streams
+          spawned from that model's engine.model_seed, so a run is
+          reproducible for a given seed and chunk size.
+        - meta_model (bool): Also summarise the summed risk of all models
+
+    Yields:
+        - n_done (int): Simulations completed so far
+        - summaries (dict): Model name -> node name -> RunningSummary. The
+          summed risk appears under "Meta Model" -> "Risk". The same objects
+          are updated in place after every chunk.
+    """
+    sizes = chunk_sizes(n_simulations, chunk_size)
+    seeds = {
+        name: chunk_seeds(engine.model_seed(random_seed, i), len(sizes))
+        for i, name in enumerate(model_inputs)
+    }
+    summaries = {}
+    vulnerabilities = {}
+    for name, inputs in model_inputs.items():
+        columns, calculated = engine.model_layout(inputs)
+        for target, params in inputs.items():
+            engine.check_inputs(
+                target, params.get("low"), params.get("mode"), params.get("high")
+            )
+        bounds = node_upper_bounds(inputs)
+        summaries[name] = {
+            column: RunningSummary(bounds[column], n_bins) for column in columns
+        }
+        if "Vulnerability" in calculated:
+            vulnerabilities[name] = _step_vulnerability(inputs, sizes, seeds[name])
+    if meta_model:
+        upper = sum(model["Risk"].upper for model in summaries.values())
+        summaries["Meta Model"] = {"Risk": RunningSummary(upper, n_bins)}
+
+    n_done = 0
+    for chunk, size in enumerate(sizes):
+        total = np.zeros(size) if meta_model else None
+        for name, inputs in model_inputs.items():
+            result = engine.simulate_model(
+                inputs,
+                size,
+                random_seed=seeds[name][chunk],
+                vulnerability=vulnerabilities.get(name),
+            )
+            for column in result.columns:
+                summaries[name][column].update(result[column])
+            if total is not None:
+                total += result["Risk"]
+        if total is not None:
+            summaries["Meta Model"]["Risk"].update(total)
+        n_done += size
+        yield n_done, summaries
+
+
+def risk_summary_frame(summaries):
+    """Tabulates the Risk summary of every model, one row per model."""
+    return pd.DataFrame(
+        {name: nodes["Risk"].to_dict() for name, nodes in summaries.items()}
+    ).T
+
+
+def risk_histogram(summary, n_bins=50):
+    """Coarsens a RunningSummary histogram to n_bins bars for display."""
+    factor = max(summary.n_bins // n_bins, 1)
+    counts = summary.counts[: summary.n_bins // factor * factor]
+    counts = counts.reshape(-1, factor).sum(axis=1)
+    midpoints = (np.arange(counts.size) + 0.5) * summary.bin_width * factor
+    return pd.Series(counts, index=np.round(midpoints, 2), name="Simulations")
@@ -0,0 +1,106 @@
+"""
+Headline annual loss statistics computed straight from the simulation arrays.
+
+This is the fast path for showing results: one sort per model gives the
+mean, percentiles, Value at Risk and expected shortfall, and the loss
+exceedance curve, all of which Streamlit draws natively. The full pyfair
+report with its matplotlib charts is only rendered when asked for.
+"""
+
+import numpy as np
+import pandas as pd
+
+PERCENTILES = (0.05, 0.1, 0.5, 0.9)
+VAR_LEVELS = (0.95, 0.99)
+EXCEEDANCE_POINTS = 200
+
+
+def ale_summary(risk, replicates=None):
+    """
+    Summarises the simulated annual loss of one model.
+
+    VaR at level q is the q-quantile of annual loss (linear interpolation, as
+    numpy and pandas use). Expected shortfall (ES) at q is the mean of the
+    losses at or above that VaR.
+
+    Std Error is the standard error of the mean (ALE). For independent
+    draws it is Stdev / sqrt(n). For a stratified sample (see
+    engine.sample_uniforms) pass its replicate block sizes, and it is the
+    spread of the block means instead, which credits the stratification.
+
+    Returns:
+        - dict: Simulations, Mean, Std Error, Stdev, Minimum, P5..P90,
+          Maximum, VaR 95%, VaR 99%, ES 95%, ES 99%
+    """
+    risk = np.asarray(risk, dtype=np.float64)
+    ordered = np.sort(risk)
+    n = ordered.size
+    stdev = float(ordered.std(ddof=1)) if n > 1 else 0.0
+    if replicates is None:
+        error = stdev / np.sqrt(n)
+    else:
+        block_means = np.add.reduceat(
+            risk, np.cumsum([0] + list(replicates[:-1]))
+        ) / np.asarray(replicates)
+        error = float(block_means.std(ddof=1) / np.sqrt(len(replicates)))
+    stats = {
+        "Simulations": n,
+        "Mean": float(ordered.mean()),
+        "Std Error": error,
+        "Stdev": stdev,
+        "Minimum": float(ordered[0]),
+    }
+    for q in PERCENTILES:
+        stats[f"P{q * 100:g}"] = _sorted_quantile(ordered, q)
+    stats["Maximum"] = float(ordered[-1])
+    for q in VAR_LEVELS:
+        var = _sorted_quantile(ordered, q)
+        stats[f"VaR {q * 100:g}%"] = var
+        stats[f"ES {q * 100:g}%"] = float(
+            ordered[np.searchsorted(ordered, var, side="left") :].mean()
+        )
+    return stats
+
+
+def _sorted_quantile(ordered, q):
+    """np.quantile's default (linear) method on already sorted data."""
+    position = q * (ordered.size - 1)
+    below = int(np.floor(position))
+    above = min(below + 1, ordered.size - 1)
+    weight = position - below
+    return float(ordered[below] + (ordered[above] - ordered[below]) * weight)
+
+
+def summary_table(risks, replicates=None):
+    """
+    Tabulates ale_summary for several models.
+
+    Parameters:
+        - risks (dict): Model name -> simulated annual loss array
+        - replicates (list): Optional replicate block sizes shared by all
+          models, as for ale_summary
+
+    Returns:
+        - pd.DataFrame: One row per model, indexed by name
+    """
+    return pd.DataFrame(
+        {name: ale_summary(risk, replicates) for name, risk in risks.items()}
+    ).T
+
+
+def exceedance_curve(risks, n_points=EXCEEDANCE_POINTS):
+    """
+    Loss exceedance curves: the share of years with a loss of at least each level.
+
+    Returns:
+        - pd.DataFrame: Indexed by loss, one column of exceedance
+          probabilities per model
+    """
+    upper = max(float(np.max(risk)) for risk in risks.values())
+    levels = np.linspace(0.0, upper, n_points)
+    curves = {}
+    for name, risk in risks.items():
+        # Histogram counts over the levels, summed from the top, avoid a sort
+        counts, _ = np.histogram(risk, bins=np.append(levels, np.inf))
+        curves[name] = np.cumsum(counts[::-1])[::-1] / np.size(risk)
+    return pd.DataFrame(curves, index=pd.Index(np.round(levels, 2), name="Loss"))
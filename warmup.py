@@ -0,0 +1,113 @@
+"""
+Warm start: load heavy dependencies before the first calculation needs them.
+
+pyfair pulls in matplotlib and scipy.stats, which take about a second to
+import and are most of the app's cold start. The app modules import them
+where first used rather than at the top, so the first page renders straight
+away, and the app calls start() once per process to load them on a
+background thread while the user fills in the form. The same thread builds
+the engine's inverse-CDF tables for the default inputs and matplotlib's
+font cache, which the first calculation and report would otherwise pay for.
+"""
+
+import importlib
+import logging
+import threading
+import time
+
+import engine
+import metrics
+import portfolio
+
+logger = logging.getLogger(__name__)
+
+# Imported by warm_up, in order
+MODULES = (
+    "scipy.stats",
+    "matplotlib.figure",
+    "matplotlib.backends.backend_agg",
+    "pyfair",
+)
+# Draws per model when exercising the engine
+WARM_UP_SIMULATIONS = 1000
+
+
+def default_inputs():
+    """Engine inputs of the app's default model for every use_tef/use_vuln layout."""
+    return [
+        portfolio.scenario_inputs(
+            portfolio.default_scenarios(use_tef, use_vuln, 1).iloc[0],
+            use_tef,
+            use_vuln,
+        )
+        for use_tef in (True, False)
+        for use_vuln in (True, False)
+    ]
+
+
+def warm_up(model_inputs=None):
+    """
+    Imports MODULES and runs each engine path once on small inputs.
+
+    Parameters:
+        - model_inputs (list): Engine input dicts to simulate; their PERT
+          tables stay cached in engine.ppf_table. Defaults to default_inputs()
+
+    Returns:
+        - dict: Step name -> seconds taken. Each step is also recorded as a
+          "warm_up" metric.
+    """
+    timings = {}
+
+    def step(name, func):
+        started = time.perf_counter()
+        func()
+        timings[name] = time.perf_counter() - started
+        metrics.record("warm_up", timings[name], step=name)
+
+    for module in MODULES:
+        step(f"import {module}", lambda: importlib.import_module(module))
+
+    def simulate():
+        for inputs in model_inputs or default_inputs():
+            for sampler in engine.SAMPLERS:
+                result = engine.simulate_model(
+                    inputs, WARM_UP_SIMULATIONS, sampler=sampler
+                )
+            # Wrapping does not depend on the sampler, so one result per
+            # input set is enough to warm it
+            engine.to_fair_model("Warm-up", inputs, result)
+
+    step("engine", simulate)
+
+    def draw():
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        figure = Figure()
+        figure.subplots().plot([0, 1], [0, 1], label="warm-up")
+        figure.legend()
+        FigureCanvasAgg(figure).draw()
+
+    step("matplotlib", draw)
+    return timings
+
+
+def start(model_inputs=None):
+    """
+    Runs warm_up on a daemon thread and returns the thread.
+
+    Callers should start it once per process (main.py uses
+    st.cache_resource); a failure only loses the head start, so it is
+    logged rather than raised.
+    """
+
+    def run():
+        try:
+            warm_up(model_inputs)
+        except Exception:
+            logger.exception("Warm-up failed")
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread